@@ -0,0 +1,310 @@
+"""Command-line interface for querying and proxying OpenVPN management interfaces.
+
+Example usage:
+
+    openvpn-api query -c state -c stats localhost:7505 /run/openvpn/server.sock
+    openvpn-api query -c stats --format csv --watch 10 vpn1:7505 vpn2:7505
+    openvpn-api proxy --listen /run/openvpn-api/proxy.sock localhost:7505
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import datetime
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, IO, Iterable, List, Optional, Sequence
+
+from openvpn_api.health import EndpointHealth
+from openvpn_api.proxy import ManagementProxy
+from openvpn_api.util import errors
+from openvpn_api.vpn import VPN
+
+# Output fields for each supported query command, used to build CSV headers
+COMMAND_FIELDS = {
+    "state": (
+        "mode",
+        "up_since",
+        "state_name",
+        "desc_string",
+        "local_virtual_v4_addr",
+        "remote_addr",
+        "remote_port",
+        "local_addr",
+        "local_port",
+        "local_virtual_v6_addr",
+    ),
+    "stats": ("client_count", "bytes_in", "bytes_out"),
+    "status": ("updated_at", "client_count", "routing_count", "bytes_received", "bytes_sent"),
+    "version": ("release", "version"),
+}
+
+# Fields present on every output row
+BASE_FIELDS = ("timestamp", "endpoint", "command", "ok", "error")
+
+# Exceptions which indicate a failed query against a single endpoint rather than a bug
+QUERY_ERRORS = (errors.VPNError, OSError, AssertionError, ValueError)
+
+Row = Dict[str, Any]
+
+
+def parse_endpoint(value: str, **kwargs: Any) -> VPN:
+    """Create VPN object from an endpoint string.
+
+    Endpoints are either `host:port` (`[v6addr]:port` for IPv6) or a path to a unix socket.
+    Any keyword arguments are passed through to the VPN object.
+    """
+    host, sep, port = value.rpartition(":")
+    if sep and host and port.isdigit():
+        if host.startswith("[") and host.endswith("]"):
+            host = host[1:-1]
+        return VPN(host=host, port=int(port), **kwargs)
+    return VPN(unix_socket=value, **kwargs)
+
+
+def _format_value(value: Any) -> Any:
+    """Convert value into something JSON serialisable."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _query_state(vpn: VPN) -> Row:
+    state = vpn.get_state()
+    return {field: _format_value(getattr(state, field)) for field in COMMAND_FIELDS["state"]}
+
+
+def _query_stats(vpn: VPN) -> Row:
+    stats = vpn.get_stats()
+    return {field: _format_value(getattr(stats, field)) for field in COMMAND_FIELDS["stats"]}
+
+
+def _query_status(vpn: VPN) -> Row:
+    status = vpn.get_status()
+    clients = status.client_list.values()
+    return {
+        "updated_at": _format_value(status.updated_at),
+        "client_count": len(status.client_list),
+        "routing_count": len(status.routing_table),
+        "bytes_received": sum(int(client.bytes_received) for client in clients),
+        "bytes_sent": sum(int(client.bytes_sent) for client in clients),
+    }
+
+
+def _query_version(vpn: VPN) -> Row:
+    return {"release": vpn.release, "version": vpn.version}
+
+
+QUERIES: Dict[str, Callable[[VPN], Row]] = {
+    "state": _query_state,
+    "stats": _query_stats,
+    "status": _query_status,
+    "version": _query_version,
+}
+
+
+def query_endpoint(vpn: VPN, commands: Sequence[str], keep_open: bool = False) -> List[Row]:
+    """Run each command against a single management interface and return one row per command.
+
+    Commands are issued serially over one connection as the management interface handles one command at a time.
+    If `keep_open` is set the connection is left open for the next call, otherwise it is closed once done.
+    Errors are reported in the row for the command which raised them rather than propagated. If connecting fails the
+    remaining commands are reported as failed with the same error, rather than each waiting for a connect timeout.
+    """
+    rows = []
+    connect_error: Optional[str] = None
+    for command in commands:
+        row: Row = {
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "endpoint": vpn.mgmt_address,
+            "command": command,
+            "ok": True,
+            "error": None,
+        }
+        if connect_error is not None:
+            row["ok"] = False
+            row["error"] = connect_error
+            rows.append(row)
+            continue
+        try:
+            if not vpn.is_connected:
+                try:
+                    vpn.connect()
+                except QUERY_ERRORS as e:
+                    connect_error = str(e) or e.__class__.__name__
+                    raise
+            row.update(QUERIES[command](vpn))
+        except QUERY_ERRORS as e:
+            row["ok"] = False
+            row["error"] = str(e) or e.__class__.__name__
+            # Connection is in an unknown state, drop it so the next attempt starts afresh
+            _close(vpn, quit_=False)
+        rows.append(row)
+    if not keep_open:
+        _close(vpn)
+    return rows
+
+
+def _close(vpn: VPN, quit_: bool = True) -> None:
+    """Disconnect from management interface, ignoring any errors raised while doing so."""
+    try:
+        vpn.disconnect(_quit=quit_)
+    except QUERY_ERRORS:
+        vpn.disconnect(_quit=False)
+
+
+class RowWriter:
+    """Write result rows to a stream as either NDJSON or CSV, flushing after every row."""
+
+    def __init__(self, stream: IO[str], fmt: str, commands: Sequence[str]) -> None:
+        self._stream = stream
+        self._csv: Optional[csv.DictWriter] = None
+        if fmt == "csv":
+            fields = list(BASE_FIELDS)
+            for command in commands:
+                fields.extend(f for f in COMMAND_FIELDS[command] if f not in fields)
+            self._csv = csv.DictWriter(stream, fieldnames=fields, restval="", extrasaction="ignore")
+            self._csv.writeheader()
+            self._stream.flush()
+
+    def write(self, row: Row) -> None:
+        if self._csv is not None:
+            self._csv.writerow({k: "" if v is None else v for k, v in row.items()})
+        else:
+            self._stream.write(json.dumps(row) + "\n")
+        self._stream.flush()
+
+
+def run_query(
+    vpns: Sequence[VPN],
+    commands: Sequence[str],
+    writer: RowWriter,
+    workers: int = 8,
+    watch: Optional[float] = None,
+    count: Optional[int] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> bool:
+    """Query all management interfaces concurrently, writing rows as each endpoint completes.
+
+    In watch mode endpoints are queried every `watch` seconds, keeping connections open between iterations, until
+    `count` iterations have run (or forever if not set).
+    Returns True if every query succeeded.
+    """
+    ok = True
+    iteration = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        try:
+            while True:
+                started = time.monotonic()
+                futures = [executor.submit(query_endpoint, vpn, commands, watch is not None) for vpn in vpns]
+                for future in concurrent.futures.as_completed(futures):
+                    for row in future.result():
+                        ok = ok and row["ok"]
+                        writer.write(row)
+                iteration += 1
+                if watch is None or (count is not None and iteration >= count):
+                    break
+                sleep(max(0.0, watch - (time.monotonic() - started)))
+        finally:
+            for vpn in vpns:
+                _close(vpn)
+    return ok
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="openvpn-api", description="Query OpenVPN management interfaces.")
+    subparsers = parser.add_subparsers(dest="action")
+    subparsers.required = True
+
+    query = subparsers.add_parser("query", help="Query one or more management interfaces concurrently.")
+    query.add_argument(
+        "endpoints", nargs="+", metavar="ENDPOINT", help="Management interface as host:port or path to unix socket."
+    )
+    query.add_argument(
+        "-c",
+        "--command",
+        dest="commands",
+        action="append",
+        choices=sorted(QUERIES),
+        help="Command to run against each endpoint, may be given multiple times (default: stats).",
+    )
+    query.add_argument("-f", "--format", choices=("ndjson", "csv"), default="ndjson", help="Output format.")
+    query.add_argument("-w", "--workers", type=int, default=8, help="Maximum endpoints to query at once.")
+    query.add_argument(
+        "--watch", type=float, metavar="SECONDS", help="Repeat queries every SECONDS, keeping connections open."
+    )
+    query.add_argument("--count", type=int, help="Stop after this many iterations in watch mode.")
+    query.add_argument(
+        "--connect-timeout", type=float, default=3.0, metavar="SECONDS", help="Timeout connecting to each endpoint."
+    )
+    query.add_argument(
+        "--timeout", type=float, metavar="SECONDS", help="Timeout for the full response to each command to arrive."
+    )
+    query.add_argument(
+        "--failure-threshold",
+        type=int,
+        metavar="N",
+        help="In watch mode, skip endpoints after N consecutive failures, retrying with exponential backoff.",
+    )
+
+    proxy = subparsers.add_parser(
+        "proxy", help="Share a single management interface connection between many clients on a unix socket."
+    )
+    proxy.add_argument("endpoint", metavar="ENDPOINT", help="Management interface as host:port or path to unix socket.")
+    proxy.add_argument("-l", "--listen", required=True, metavar="PATH", help="Unix socket to listen for clients on.")
+    proxy.add_argument(
+        "--connect-timeout", type=float, default=3.0, metavar="SECONDS", help="Timeout connecting to the endpoint."
+    )
+    proxy.add_argument(
+        "--timeout", type=float, default=30.0, metavar="SECONDS", help="Timeout for each command's response to arrive."
+    )
+    return parser
+
+
+def _main_proxy(args: argparse.Namespace) -> int:
+    try:
+        vpn = parse_endpoint(args.endpoint, connect_timeout=args.connect_timeout)
+    except errors.VPNError as e:
+        print(f"openvpn-api: {e}", file=sys.stderr)
+        return 2
+    proxy = ManagementProxy(vpn, args.listen, timeout=args.timeout)
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        proxy.shutdown()
+    return 0
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    args = build_parser().parse_args(None if argv is None else list(argv))
+    if args.action == "proxy":
+        return _main_proxy(args)
+    commands = args.commands or ["stats"]
+    try:
+        vpns = [
+            parse_endpoint(
+                endpoint,
+                connect_timeout=args.connect_timeout,
+                timeout=args.timeout,
+                health=EndpointHealth(failure_threshold=args.failure_threshold) if args.failure_threshold else None,
+            )
+            for endpoint in args.endpoints
+        ]
+    except errors.VPNError as e:
+        print(f"openvpn-api: {e}", file=sys.stderr)
+        return 2
+    writer = RowWriter(sys.stdout, args.format, commands)
+    try:
+        ok = run_query(vpns, commands, writer, workers=args.workers, watch=args.watch, count=args.count)
+    except KeyboardInterrupt:
+        return 130
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
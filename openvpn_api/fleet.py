@@ -0,0 +1,261 @@
+"""Summary of a fleet of OpenVPN servers, kept up to date as each server is polled.
+
+Rather than recalculating fleet wide figures from every server's latest results each time they're asked for,
+`FleetSummary` adjusts its totals by the difference between a server's previous and latest results as they come in.
+Totals and per-state counts can then be read in constant time, and the busiest servers and clients are kept ranked in
+heaps so the top few can be read without sorting the whole fleet.
+
+Example usage:
+
+    summary = FleetSummary()
+    poller = AdaptivePoller(vpns, callback=summary.on_poll)
+    ...
+    summary.client_count, summary.rate_in, summary.rate_out
+    summary.top_endpoints(10)
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from openvpn_status.models import Status
+
+from openvpn_api.models.state import State
+from openvpn_api.models.stats import ServerStats
+from openvpn_api.vpn import VPN
+
+K = TypeVar("K", bound=Hashable)
+
+# (endpoint, client real address, client common name)
+ClientKey = Tuple[str, str, str]
+
+
+class _Ranking(Generic[K]):
+    """Keys ranked by score, highest first.
+
+    Updating or removing a key doesn't search the heap for its old entry, which is left in place and skipped when
+    reached. The heap is rebuilt once stale entries outnumber live ones so it doesn't grow without bound.
+    """
+
+    def __init__(self) -> None:
+        self._scores: Dict[K, Tuple[float, int]] = {}
+        self._heap: List[Tuple[float, int, K]] = []
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def set(self, key: K, score: float) -> None:
+        seq = next(self._seq)
+        self._scores[key] = (score, seq)
+        heapq.heappush(self._heap, (-score, seq, key))
+        self._maybe_compact()
+
+    def discard(self, key: K) -> None:
+        if self._scores.pop(key, None) is not None:
+            self._maybe_compact()
+
+    def _is_live(self, entry: Tuple[float, int, K]) -> bool:
+        current = self._scores.get(entry[2])
+        return current is not None and current[1] == entry[1]
+
+    def _maybe_compact(self) -> None:
+        if len(self._heap) > 2 * len(self._scores) + 32:
+            self._heap = [(-score, seq, key) for key, (score, seq) in self._scores.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, n: int) -> List[Tuple[K, float]]:
+        """Get the `n` highest scoring keys with their scores."""
+        found: List[Tuple[float, int, K]] = []
+        while self._heap and len(found) < n:
+            entry = heapq.heappop(self._heap)
+            if self._is_live(entry):
+                found.append(entry)
+        for entry in found:
+            heapq.heappush(self._heap, entry)
+        return [(key, -score) for score, _, key in found]
+
+
+class EndpointSummary:
+    """Latest results from a single server which contribute to the fleet totals."""
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.stats: Optional[ServerStats] = None
+        # Time the latest stats were fetched
+        self.stats_at: Optional[float] = None
+        # Bytes per second in and out of the server between its last two stats
+        self.rate_in: float = 0.0
+        self.rate_out: float = 0.0
+        self.state_name: Optional[str] = None
+        # Total bytes received and sent by each client at its latest status, and the time that status was recorded
+        self.clients: Dict[ClientKey, int] = {}
+        self.clients_at: Optional[float] = None
+        # Bytes per second in and out of each client between its last two statuses
+        self.client_rates: Dict[ClientKey, float] = {}
+        # Error from the latest poll if it failed
+        self.error: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f"<EndpointSummary name='{self.name}', state={self.state_name}, error={self.error}>"
+
+
+class FleetSummary:
+    """Fleet wide totals, per-state counts and top talkers, updated incrementally as each server's results arrive."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.endpoints: Dict[str, EndpointSummary] = {}
+
+        self.client_count: int = 0
+        self.bytes_in: int = 0
+        self.bytes_out: int = 0
+        # Sum of every server's bytes per second in and out
+        self.rate_in: float = 0.0
+        self.rate_out: float = 0.0
+        # Number of servers in each state, as last seen by update_state
+        self.state_counts: Dict[str, int] = {}
+        # Number of servers whose latest poll failed
+        self.endpoints_down: int = 0
+
+        self._endpoint_rates: _Ranking[str] = _Ranking()
+        self._client_rates: _Ranking[ClientKey] = _Ranking()
+
+    def _get(self, endpoint: str) -> EndpointSummary:
+        summary = self.endpoints.get(endpoint)
+        if summary is None:
+            summary = self.endpoints[endpoint] = EndpointSummary(endpoint)
+        return summary
+
+    def _set_error(self, summary: EndpointSummary, error: Optional[str]) -> None:
+        self.endpoints_down += (error is not None) - (summary.error is not None)
+        summary.error = error
+
+    def _set_stats(self, summary: EndpointSummary, stats: Optional[ServerStats], timestamp: Optional[float]) -> None:
+        old = summary.stats
+        if old is not None:
+            self.client_count -= old.client_count or 0
+            self.bytes_in -= old.bytes_in or 0
+            self.bytes_out -= old.bytes_out or 0
+        if stats is not None:
+            self.client_count += stats.client_count or 0
+            self.bytes_in += stats.bytes_in or 0
+            self.bytes_out += stats.bytes_out or 0
+
+        rate_in = rate_out = 0.0
+        if old is not None and stats is not None and summary.stats_at is not None and timestamp is not None:
+            elapsed = timestamp - summary.stats_at
+            delta_in = (stats.bytes_in or 0) - (old.bytes_in or 0)
+            delta_out = (stats.bytes_out or 0) - (old.bytes_out or 0)
+            # Counters going backwards means the server restarted, there's no meaningful rate until the next sample
+            if elapsed > 0 and delta_in >= 0 and delta_out >= 0:
+                rate_in, rate_out = delta_in / elapsed, delta_out / elapsed
+        self.rate_in += rate_in - summary.rate_in
+        self.rate_out += rate_out - summary.rate_out
+        summary.rate_in, summary.rate_out = rate_in, rate_out
+        summary.stats, summary.stats_at = stats, timestamp
+        if stats is None:
+            self._endpoint_rates.discard(summary.name)
+        else:
+            self._endpoint_rates.set(summary.name, rate_in + rate_out)
+
+    def _set_state(self, summary: EndpointSummary, state_name: Optional[str]) -> None:
+        if summary.state_name is not None:
+            remaining = self.state_counts[summary.state_name] - 1
+            if remaining:
+                self.state_counts[summary.state_name] = remaining
+            else:
+                del self.state_counts[summary.state_name]
+        if state_name is not None:
+            self.state_counts[state_name] = self.state_counts.get(state_name, 0) + 1
+        summary.state_name = state_name
+
+    def _set_clients(self, summary: EndpointSummary, clients: Dict[ClientKey, int], timestamp: Optional[float]) -> None:
+        for key in summary.clients.keys() - clients.keys():
+            self._client_rates.discard(key)
+        elapsed = None
+        if timestamp is not None and summary.clients_at is not None:
+            elapsed = timestamp - summary.clients_at
+        rates: Dict[ClientKey, float] = {}
+        for key, total in clients.items():
+            previous = summary.clients.get(key)
+            rate = 0.0
+            # New clients, or those whose counters went backwards after reconnecting, have no rate until the next status
+            if previous is not None and elapsed is not None and elapsed > 0 and total >= previous:
+                rate = (total - previous) / elapsed
+            if summary.client_rates.get(key) != rate:
+                self._client_rates.set(key, rate)
+            rates[key] = rate
+        summary.clients, summary.client_rates, summary.clients_at = clients, rates, timestamp
+
+    def update_stats(self, endpoint: str, stats: ServerStats, timestamp: Optional[float] = None) -> None:
+        """Record the latest `load-stats` result for a server, fetched at `timestamp` (defaulting to now)."""
+        with self._lock:
+            summary = self._get(endpoint)
+            self._set_stats(summary, stats, self._clock() if timestamp is None else timestamp)
+            self._set_error(summary, None)
+
+    def update_state(self, endpoint: str, state: State) -> None:
+        """Record the latest `state` result for a server."""
+        with self._lock:
+            self._set_state(self._get(endpoint), state.state_name)
+
+    def update_status(self, endpoint: str, status: Status, timestamp: Optional[float] = None) -> None:
+        """Record the latest `status` result for a server, fetched at `timestamp` (defaulting to now).
+        Its clients are ranked by bytes per second transferred since the server's previous status.
+        """
+        clients = {
+            (endpoint, str(address), str(client.common_name)): int(client.bytes_received) + int(client.bytes_sent)
+            for address, client in status.client_list.items()
+        }
+        with self._lock:
+            self._set_clients(self._get(endpoint), clients, self._clock() if timestamp is None else timestamp)
+
+    def record_error(self, endpoint: str, error: Exception) -> None:
+        """Mark a server as down after a failed poll, its last results still count towards the totals."""
+        with self._lock:
+            self._set_error(self._get(endpoint), str(error))
+
+    def remove(self, endpoint: str) -> None:
+        """Stop tracking a server, removing all its contributions to the totals."""
+        with self._lock:
+            summary = self.endpoints.get(endpoint)
+            if summary is None:
+                return
+            self._set_stats(summary, None, None)
+            self._set_state(summary, None)
+            self._set_clients(summary, {}, None)
+            self._set_error(summary, None)
+            del self.endpoints[endpoint]
+
+    def on_poll(self, vpn: VPN, stats: Optional[ServerStats], error: Optional[Exception]) -> None:
+        """Record a poll result, with the same signature as an `AdaptivePoller` callback."""
+        if stats is not None:
+            self.update_stats(vpn.mgmt_address, stats)
+        elif error is not None:
+            self.record_error(vpn.mgmt_address, error)
+
+    @property
+    def endpoint_count(self) -> int:
+        return len(self.endpoints)
+
+    def top_endpoints(self, n: int = 10) -> List[Tuple[str, float]]:
+        """Get the `n` servers with the highest combined bytes per second in and out, busiest first."""
+        with self._lock:
+            return self._endpoint_rates.top(n)
+
+    def top_clients(self, n: int = 10) -> List[Tuple[ClientKey, float]]:
+        """Get the `n` clients with the highest combined bytes per second in and out across the fleet, busiest first.
+        Rates are measured between each server's last two statuses.
+        """
+        with self._lock:
+            return self._client_rates.top(n)
+
+    def __repr__(self) -> str:
+        return (
+            f"<FleetSummary endpoints={len(self.endpoints)}, clients={self.client_count}, "
+            f"down={self.endpoints_down}>"
+        )
@@ -0,0 +1,162 @@
+"""Health tracking and circuit breaking for management interface endpoints.
+
+Attach an `EndpointHealth` to a `VPN` and once the endpoint has failed `failure_threshold` times in a row, the circuit
+opens and `VPN.connect` raises `CircuitOpenError` immediately rather than waiting on a connect timeout. After a backoff
+period a single probe is let through (half-open); if it succeeds the circuit closes again, otherwise it re-opens with
+the backoff period doubled, up to `max_backoff`.
+
+Example usage:
+
+    vpn = VPN("localhost", 7505, health=EndpointHealth(failure_threshold=3))
+"""
+
+import threading
+import time
+from enum import Enum
+from typing import Callable, Optional
+
+
+class HealthState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class EndpointHealth:
+    """Circuit breaker and failure statistics for a single management interface."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        backoff: float = 5.0,
+        max_backoff: float = 300.0,
+        multiplier: float = 2.0,
+        smoothing: float = 0.3,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        # Consecutive failures before the circuit opens
+        self.failure_threshold: int = max(1, failure_threshold)
+        # Seconds the circuit stays open the first time it trips, multiplied by `multiplier` on each subsequent trip
+        self.backoff: float = backoff
+        self.max_backoff: float = max_backoff
+        self.multiplier: float = multiplier
+        # Weight given to the latest sample in the latency moving average
+        self.smoothing: float = smoothing
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._state: HealthState = HealthState.CLOSED
+        self._probing_since: Optional[float] = None
+        # Times the circuit has opened since it was last closed, used to calculate backoff
+        self._trips: int = 0
+
+        self.consecutive_failures: int = 0
+        self.total_successes: int = 0
+        self.total_failures: int = 0
+        # Requests refused while the circuit was open
+        self.total_rejected: int = 0
+        # Times the circuit has opened over the tracker's lifetime
+        self.total_opened: int = 0
+        self.last_error: Optional[str] = None
+        self.last_success: Optional[float] = None
+        self.last_failure: Optional[float] = None
+        # Monotonic time at which an open circuit will let a probe through
+        self.retry_at: Optional[float] = None
+        # Exponentially weighted moving average of successful request latency in seconds
+        self.latency: Optional[float] = None
+        # Exponentially weighted moving average of successful connect latency in seconds
+        self.connect_latency: Optional[float] = None
+
+    @property
+    def state(self) -> HealthState:
+        """Current circuit state, an open circuit becomes half-open once its backoff has elapsed."""
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def _update_state(self) -> None:
+        if self._state == HealthState.OPEN and self.retry_at is not None and self._clock() >= self.retry_at:
+            self._state = HealthState.HALF_OPEN
+            self._probing_since = None
+
+    def allow_request(self) -> bool:
+        """Determine if a request to the endpoint should be attempted.
+
+        Always True while closed. While half-open only one probe is allowed at a time and the caller must report its
+        outcome with `record_success` or `record_failure`.
+        """
+        with self._lock:
+            self._update_state()
+            if self._state == HealthState.CLOSED:
+                return True
+            now = self._clock()
+            if self._state == HealthState.HALF_OPEN:
+                # Let another probe through if the last one never reported back
+                if self._probing_since is None or now - self._probing_since >= self._current_backoff():
+                    self._probing_since = now
+                    return True
+            self.total_rejected += 1
+            return False
+
+    def _current_backoff(self) -> float:
+        return min(self.max_backoff, self.backoff * self.multiplier ** max(0, self._trips - 1))
+
+    def _smooth(self, average: Optional[float], sample: float) -> float:
+        return sample if average is None else (1 - self.smoothing) * average + self.smoothing * sample
+
+    def record_connect(self, latency: Optional[float] = None) -> None:
+        """Record a successful connection.
+
+        This doesn't count as a success, an endpoint which accepts connections but doesn't answer commands is still
+        unhealthy, so the circuit is only closed by a successful command reported with `record_success`.
+        """
+        with self._lock:
+            if latency is not None:
+                self.connect_latency = self._smooth(self.connect_latency, latency)
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        """Record a successful request, closing the circuit."""
+        with self._lock:
+            self.total_successes += 1
+            self.consecutive_failures = 0
+            self.last_success = self._clock()
+            if latency is not None:
+                self.latency = self._smooth(self.latency, latency)
+            self._state = HealthState.CLOSED
+            self._probing_since = None
+            self._trips = 0
+            self.retry_at = None
+
+    def record_failure(self, error: Optional[BaseException] = None) -> None:
+        """Record a failed request, opening the circuit if the failure threshold is reached or a probe failed."""
+        with self._lock:
+            self._update_state()
+            now = self._clock()
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = now
+            if error is not None:
+                self.last_error = str(error) or error.__class__.__name__
+            if self._state == HealthState.HALF_OPEN or (
+                self._state == HealthState.CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                self._trips += 1
+                self.total_opened += 1
+                self._state = HealthState.OPEN
+                self._probing_since = None
+                self.retry_at = now + self._current_backoff()
+
+    def reset(self) -> None:
+        """Close the circuit, forgetting any failures."""
+        with self._lock:
+            self._state = HealthState.CLOSED
+            self._probing_since = None
+            self._trips = 0
+            self.consecutive_failures = 0
+            self.retry_at = None
+
+    def __repr__(self) -> str:
+        return (
+            f"<EndpointHealth state='{self.state.value}', consecutive_failures={self.consecutive_failures}, "
+            f"total_failures={self.total_failures}>"
+        )
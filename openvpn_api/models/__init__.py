@@ -1,4 +1,6 @@
 import abc
+import functools
+import sys
 from ipaddress import IPv4Address, IPv6Address, ip_address
 from typing import Optional, Tuple, Union
 
@@ -6,6 +8,15 @@ from openvpn_api import constants
 
 IPAddress = Union[IPv4Address, IPv6Address]
 
+# Number of distinct parsed IP addresses kept for reuse, the same few addresses are seen on every poll of a server
+IP_ADDRESS_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=IP_ADDRESS_CACHE_SIZE)
+def _cached_ip_address(raw: str) -> IPAddress:
+    # Address objects are immutable so a single instance can safely be shared between all models
+    return ip_address(raw)
+
 
 class VPNModelBase(abc.ABC):
     """Base instance of all VPN data models with parsers."""
@@ -29,6 +40,14 @@ class VPNModelBase(abc.ABC):
             return None
         return raw
 
+    @classmethod
+    def _parse_enum_string(cls, raw: Optional[str]) -> Optional[str]:
+        """Return stripped raw interned, for fields with a small set of values repeated across many responses."""
+        raw = cls._parse_string(raw)
+        if raw is None:
+            return None
+        return sys.intern(raw)
+
     @classmethod
     def _parse_int(cls, raw: Optional[str]) -> Optional[int]:
         """Return int if raw is parsable unless raw is empty, then return None."""
@@ -43,7 +62,7 @@ class VPNModelBase(abc.ABC):
         raw = cls._parse_string(raw)
         if raw is None:
             return None
-        return ip_address(raw)
+        return _cached_ip_address(raw)
 
     @staticmethod
     def _parse_notification(line: str) -> Tuple[Optional[str], Optional[str]]:
@@ -0,0 +1,237 @@
+"""
+COMMAND -- bytecount
+--------------------
+
+The bytecount command is used to request real-time notification of OpenVPN bandwidth usage.
+
+Command syntax:
+
+  bytecount n (where n > 0) -- set up automatic notification of bandwidth usage once every n seconds
+  bytecount 0 -- turn off bytecount notifications
+
+If OpenVPN is running as a client, the bytecount notification will look like this:
+
+  >BYTECOUNT:{BYTES_IN},{BYTES_OUT}
+
+BYTES_IN is the number of bytes that have been received from the server and BYTES_OUT is the number of bytes that have
+been sent to the server.
+
+If OpenVPN is running as a server, the bytecount notification will look like this:
+
+  >BYTECOUNT_CLI:{CID},{BYTES_IN},{BYTES_OUT}
+
+CID is the Client ID, BYTES_IN is the number of bytes that have been received from the client and BYTES_OUT is the
+number of bytes that have been sent to the client.
+
+Both counts are cumulative since the connection was established.
+"""
+
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+_BYTECOUNT = ">BYTECOUNT:"
+_BYTECOUNT_CLI = ">BYTECOUNT_CLI:"
+_CLIENT_DISCONNECT = ">CLIENT:DISCONNECT,"
+
+
+class ByteCountSeries:
+    """Fixed capacity ring buffer of cumulative byte count samples.
+
+    Samples are stored in preallocated arrays so memory use is constant however long the series is recorded for, once
+    full the oldest samples are overwritten.
+    """
+
+    def __init__(self, capacity: int = 3600) -> None:
+        if capacity < 2:
+            raise ValueError("Capacity must be at least 2 samples")
+        self.capacity: int = capacity
+        self._times = array("d", [0.0]) * capacity
+        self._bytes_in = array("Q", [0]) * capacity
+        self._bytes_out = array("Q", [0]) * capacity
+        # Physical index of the oldest sample and number of samples held
+        self._start: int = 0
+        self._len: int = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, timestamp: float, bytes_in: int, bytes_out: int) -> None:
+        """Add a sample, overwriting the oldest if full."""
+        if self._len < self.capacity:
+            i = (self._start + self._len) % self.capacity
+            self._len += 1
+        else:
+            i = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._times[i] = timestamp
+        self._bytes_in[i] = bytes_in
+        self._bytes_out[i] = bytes_out
+
+    def clear(self) -> None:
+        self._start = 0
+        self._len = 0
+
+    def _index(self, n: int) -> int:
+        """Physical index of the n-th oldest sample."""
+        return (self._start + n) % self.capacity
+
+    def sample(self, n: int) -> Tuple[float, int, int]:
+        """Get the n-th oldest sample as (timestamp, bytes_in, bytes_out), negative n counts back from the latest."""
+        if n < 0:
+            n += self._len
+        if not 0 <= n < self._len:
+            raise IndexError("Sample index out of range")
+        i = self._index(n)
+        return self._times[i], self._bytes_in[i], self._bytes_out[i]
+
+    @property
+    def latest(self) -> Optional[Tuple[float, int, int]]:
+        """Most recent sample as (timestamp, bytes_in, bytes_out), or None if empty."""
+        return self.sample(-1) if self._len else None
+
+    def _window_start(self, window: Optional[float], now: Optional[float]) -> int:
+        """Logical index of the oldest sample within `window` seconds of `now` (default: latest sample time)."""
+        if window is None or self._len == 0:
+            return 0
+        if now is None:
+            now = self._times[self._index(self._len - 1)]
+        cutoff = now - window
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._times[self._index(mid)] < cutoff:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def rate(self, window: Optional[float] = None, now: Optional[float] = None) -> Tuple[float, float]:
+        """Mean (bytes_in, bytes_out) per second over the last `window` seconds, or over all samples if not given.
+
+        Counter resets (e.g. on reconnect) are handled by ignoring the interval in which the counter went backwards.
+        """
+        start = self._window_start(window, now)
+        if self._len - start < 2:
+            return 0.0, 0.0
+        total_in = total_out = 0
+        elapsed = 0.0
+        i = self._index(start)
+        for n in range(start + 1, self._len):
+            j = self._index(n)
+            if self._bytes_in[j] >= self._bytes_in[i] and self._bytes_out[j] >= self._bytes_out[i]:
+                total_in += self._bytes_in[j] - self._bytes_in[i]
+                total_out += self._bytes_out[j] - self._bytes_out[i]
+                elapsed += self._times[j] - self._times[i]
+            i = j
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return total_in / elapsed, total_out / elapsed
+
+    def rates(self, window: Optional[float] = None, now: Optional[float] = None) -> Tuple[List[float], List[float]]:
+        """Per-interval (bytes_in, bytes_out) rates in bytes/second over the last `window` seconds."""
+        start = self._window_start(window, now)
+        rates_in: List[float] = []
+        rates_out: List[float] = []
+        i = self._index(start)
+        for n in range(start + 1, self._len):
+            j = self._index(n)
+            elapsed = self._times[j] - self._times[i]
+            if elapsed > 0 and self._bytes_in[j] >= self._bytes_in[i] and self._bytes_out[j] >= self._bytes_out[i]:
+                rates_in.append((self._bytes_in[j] - self._bytes_in[i]) / elapsed)
+                rates_out.append((self._bytes_out[j] - self._bytes_out[i]) / elapsed)
+            i = j
+        return rates_in, rates_out
+
+    def percentile(
+        self, percentile: float, window: Optional[float] = None, now: Optional[float] = None
+    ) -> Tuple[float, float]:
+        """Percentile (0-100) of per-interval (bytes_in, bytes_out) rates over the last `window` seconds.
+
+        Uses linear interpolation between the closest ranks.
+        """
+        if not 0 <= percentile <= 100:
+            raise ValueError("Percentile must be between 0 and 100")
+        rates_in, rates_out = self.rates(window, now)
+        return _percentile(rates_in, percentile), _percentile(rates_out, percentile)
+
+    def __repr__(self) -> str:
+        return f"<ByteCountSeries samples={self._len}, capacity={self.capacity}>"
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    values.sort()
+    rank = (len(values) - 1) * percentile / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class ByteCountRecorder:
+    """Record `>BYTECOUNT` and `>BYTECOUNT_CLI` notifications into a `ByteCountSeries` per connection.
+
+    Client mode notifications are recorded against client ID None, server mode notifications against the client ID
+    they report on. Series for server mode clients are dropped when a `>CLIENT:DISCONNECT` notification is seen, and
+    if `max_series` is set the least recently created series are dropped to stay within it.
+
+    Samples are timestamped when fed in, which is when the notification was read rather than when it was sent. A `VPN`
+    only reads notifications while a command or `read_notifications` is running, so several may be read at once. If
+    `interval` is set to the `bytecount` interval in use, samples are spaced at least that many seconds apart so a
+    batch read together is spread out as it was sent, rather than appearing to arrive microseconds apart.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 3600,
+        max_series: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+        interval: Optional[float] = None,
+    ) -> None:
+        self.capacity: int = capacity
+        self.max_series: Optional[int] = max_series
+        self._clock = clock
+        # Seconds between byte count notifications, as set with `bytecount`
+        self.interval: Optional[float] = interval
+        self.series: Dict[Optional[int], ByteCountSeries] = {}
+
+    def _get_series(self, cid: Optional[int]) -> ByteCountSeries:
+        series = self.series.get(cid)
+        if series is None:
+            if self.max_series is not None and len(self.series) >= self.max_series:
+                del self.series[next(iter(self.series))]
+            series = self.series[cid] = ByteCountSeries(self.capacity)
+        return series
+
+    def feed(self, line: str, timestamp: Optional[float] = None) -> bool:
+        """Record a single line from the management interface, returning True if it was a byte count notification.
+
+        Lines which are not byte count or client disconnect notifications are ignored. If `timestamp` is given it is
+        used as is, otherwise the current time is used, spaced from the previous sample by `interval` if set.
+        """
+        if line.startswith(_BYTECOUNT):
+            comma = line.index(",", len(_BYTECOUNT))
+            cid = None
+            bytes_in = int(line[len(_BYTECOUNT) : comma])
+        elif line.startswith(_BYTECOUNT_CLI):
+            cid_end = line.index(",", len(_BYTECOUNT_CLI))
+            comma = line.index(",", cid_end + 1)
+            cid = int(line[len(_BYTECOUNT_CLI) : cid_end])
+            bytes_in = int(line[cid_end + 1 : comma])
+        else:
+            if line.startswith(_CLIENT_DISCONNECT):
+                self.series.pop(int(line[len(_CLIENT_DISCONNECT) :]), None)
+            return False
+        bytes_out = int(line[comma + 1 :])
+        series = self._get_series(cid)
+        if timestamp is None:
+            timestamp = self._clock()
+            latest = series.latest
+            if self.interval is not None and latest is not None:
+                timestamp = max(timestamp, latest[0] + self.interval)
+        series.append(timestamp, bytes_in, bytes_out)
+        return True
+
+    def __repr__(self) -> str:
+        return f"<ByteCountRecorder series={len(self.series)}>"
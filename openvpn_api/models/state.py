@@ -85,9 +85,9 @@ class State(VPNModelBase):
             # 0 - Unix timestamp of server start (UTC?)
             up_since = datetime.datetime.utcfromtimestamp(int(parts[0])) if parts[0] != "" else None
             # 1 - Connection state
-            state_name = cls._parse_string(parts[1])
+            state_name = cls._parse_enum_string(parts[1])
             # 2 - Connection state description
-            desc_string = cls._parse_string(parts[2])
+            desc_string = cls._parse_enum_string(parts[2])
             # 3 - TUN/TAP local v4 address
             local_virtual_v4_addr = cls._parse_ipaddress(parts[3])
             # 4 - Remote server address (client only)
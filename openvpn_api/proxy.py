@@ -0,0 +1,418 @@
+"""Management interface multiplexing proxy.
+
+OpenVPN's management interface handles commands from one client at a time, so many consumers (exporters, admin UIs,
+auth handlers...) each opening their own connection contend with each other. `ManagementProxy` holds a single
+upstream connection to the management interface and listens on a unix socket which any number of downstream clients
+can connect to and speak the normal management protocol over.
+
+Commands from downstream clients are serialised onto the upstream connection. Identical concurrent read-only commands
+(e.g. `status` or `load-stats`) are coalesced so they're answered from a single upstream call. Real-time
+notifications (lines starting with `>`) from upstream are sent to every downstream client.
+
+Note that commands which change what notifications are sent (e.g. `state on`, `bytecount 5`) affect the shared
+upstream connection, so their notifications are sent to all downstream clients.
+
+Example usage:
+
+    proxy = ManagementProxy(VPN("localhost", 7505), "/run/openvpn-api/proxy.sock")
+    proxy.serve_forever()
+"""
+
+import codecs
+import concurrent.futures
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+from typing import Dict, List, Optional, Set
+
+from openvpn_api.util import errors
+from openvpn_api.util.protocol import LineBuffer, is_notification, is_response_end
+from openvpn_api.vpn import VPN
+
+logger = logging.getLogger(__name__)
+
+# Read-only commands whose concurrent identical requests are answered from a single upstream call
+COALESCE_COMMANDS = frozenset(
+    ("help", "load-stats", "pid", "state", "status", "status 1", "status 2", "status 3", "version")
+)
+
+# Commands handled by the proxy which close the downstream connection rather than being passed upstream
+_QUIT_COMMANDS = ("quit", "exit")
+
+# Commands followed by lines of input up to an `END` line, which upstream only answers once the whole block is sent
+MULTILINE_COMMANDS = frozenset(("certificate", "client-auth", "client-pf", "pk-sig", "rsa-sig"))
+
+_GREETING = ">INFO:OpenVPN Management Interface Version 1 -- proxied by openvpn-api\r\n"
+
+
+class _PendingCommand:
+    """Response being collected from upstream for a command."""
+
+    def __init__(self, cmd: str) -> None:
+        self.cmd: str = cmd
+        self.lines: List[str] = []
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def add_line(self, line: str) -> bool:
+        """Add a response line, returning True once the response is complete."""
+        self.lines.append(line)
+        return is_response_end(line, len(self.lines) == 1)
+
+
+class _Downstream:
+    """A connected downstream client with its own bounded outgoing queue, drained by a writer thread."""
+
+    def __init__(self, sock: socket.socket, max_queue: int) -> None:
+        self.sock = sock
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._closed = threading.Event()
+        # Set if the client was dropped for not keeping up with the data sent to it
+        self.overflowed: bool = False
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def send(self, data: str) -> bool:
+        """Queue data to send to the client, returning False if the client can't keep up and has been dropped."""
+        if self._closed.is_set():
+            return False
+        try:
+            self._queue.put_nowait(data)
+            return True
+        except queue.Full:
+            logger.warning("Dropping downstream client which isn't reading its data")
+            self.overflowed = True
+            self.close()
+            return False
+
+    def _write_loop(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is None or self._closed.is_set():
+                break
+            try:
+                self.sock.sendall(data.encode("utf-8"))
+            except OSError:
+                break
+        self.close()
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _ClientHandler(socketserver.StreamRequestHandler):
+    """Read commands from a downstream client and reply with the upstream response."""
+
+    server: "_ProxyServer"
+
+    def handle(self) -> None:
+        proxy = self.server.proxy
+        client = proxy._add_client(self.request)
+        try:
+            client.send(_GREETING)
+            lines = iter(self.rfile)
+            for raw in lines:
+                cmd = raw.decode("utf-8", "replace").strip()
+                if not cmd:
+                    continue
+                if cmd in _QUIT_COMMANDS:
+                    break
+                if cmd.split(" ", 1)[0] in MULTILINE_COMMANDS:
+                    # Send the command and its input upstream as one block, once the client has sent all of it
+                    block = [cmd]
+                    for raw in lines:
+                        line = raw.decode("utf-8", "replace").rstrip("\r\n")
+                        block.append(line)
+                        if line.strip() == "END":
+                            break
+                    else:
+                        break
+                    cmd = "\n".join(block)
+                try:
+                    resp = proxy.execute(cmd)
+                except errors.VPNError as e:
+                    resp = f"ERROR: {e}\r\n"
+                if not client.send(resp):
+                    break
+        except OSError:
+            pass
+        finally:
+            proxy._remove_client(client)
+
+
+class _ProxyServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, proxy: "ManagementProxy") -> None:
+        self.proxy = proxy
+        super().__init__(path, _ClientHandler)
+
+
+class ManagementProxy:
+    """Share a single management interface connection between many clients connecting to a unix socket."""
+
+    def __init__(
+        self,
+        vpn: VPN,
+        path: str,
+        coalesce: Optional[Set[str]] = None,
+        timeout: float = 30.0,
+        max_client_queue: int = 1000,
+    ) -> None:
+        self.vpn: VPN = vpn
+        self.path: str = path
+        self.coalesce = COALESCE_COMMANDS if coalesce is None else frozenset(coalesce)
+        # Seconds to wait for upstream to respond to a command before dropping the upstream connection
+        self.timeout: float = timeout
+        # Outgoing messages buffered per downstream client before it is considered too slow and dropped
+        self.max_client_queue: int = max_client_queue
+
+        self._clients: Set[_Downstream] = set()
+        self._clients_lock = threading.Lock()
+        # Held while a command is in flight upstream, serialising commands
+        self._command_lock = threading.Lock()
+        # Guards _pending and _inflight
+        self._state_lock = threading.Lock()
+        self._pending: Optional[_PendingCommand] = None
+        self._inflight: Dict[str, _PendingCommand] = {}
+        self._reader: Optional[threading.Thread] = None
+        # Socket the reader thread is currently reading from
+        self._upstream: Optional[socket.socket] = None
+        self._server: Optional[_ProxyServer] = None
+        self._serving = threading.Event()
+
+        # Count of commands sent upstream and requests answered from a coalesced upstream call
+        self.upstream_commands: int = 0
+        self.coalesced_commands: int = 0
+        # Count of downstream clients disconnected for letting max_client_queue messages back up
+        self.clients_dropped: int = 0
+
+    @property
+    def client_count(self) -> int:
+        with self._clients_lock:
+            return len(self._clients)
+
+    def _add_client(self, sock: socket.socket) -> _Downstream:
+        client = _Downstream(sock, self.max_client_queue)
+        with self._clients_lock:
+            self._clients.add(client)
+        return client
+
+    def _remove_client(self, client: _Downstream) -> None:
+        client.close()
+        with self._clients_lock:
+            self._clients.discard(client)
+            if client.overflowed:
+                self.clients_dropped += 1
+
+    def resource_usage(self) -> Dict[str, int]:
+        """Get counters of the resources held by the proxy and its upstream connection, e.g. to export as metrics."""
+        with self._clients_lock:
+            clients = list(self._clients)
+        usage = self.vpn.resource_usage()
+        usage.update(
+            clients=len(clients),
+            client_messages_queued=sum(client.queued for client in clients),
+            clients_dropped=self.clients_dropped,
+        )
+        return usage
+
+    def broadcast(self, data: str) -> None:
+        """Send data to every downstream client."""
+        with self._clients_lock:
+            clients = list(self._clients)
+        for client in clients:
+            if not client.send(data):
+                with self._clients_lock:
+                    self._clients.discard(client)
+
+    # Upstream connection
+
+    def _ensure_upstream(self) -> None:
+        """Connect upstream and start reading from it if not already connected."""
+        if self.vpn.is_connected and self._reader is not None and self._reader.is_alive():
+            return
+        if self.vpn.is_connected:
+            self._close_upstream(quit_=False)
+        self.vpn.connect()
+        sock = self.vpn._socket
+        assert sock is not None
+        # Reader blocks until data arrives, command timeouts are handled when waiting on the response
+        sock.settimeout(None)
+        with self._state_lock:
+            self._upstream = sock
+        # Pass on anything which arrived along with the greeting
+        for line in self.vpn._drain_notifications():
+            self.broadcast(line + "\r\n")
+        # Carry on from where the greeting was read, including any incomplete line or character
+        lines = LineBuffer(self.vpn._lines.max_length)
+        lines.feed(self.vpn._lines.partial)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        decoder.setstate(self.vpn._decoder.getstate())
+        self._reader = threading.Thread(target=self._read_loop, args=(sock, lines, decoder), daemon=True)
+        self._reader.start()
+
+    def _close_upstream(self, quit_: bool = True) -> None:
+        """Disconnect upstream, waking the reader thread if it is blocked waiting for data."""
+        with self._state_lock:
+            self._upstream = None
+        if quit_ and self.vpn.is_connected:
+            try:
+                self.vpn._socket_send("quit\n")
+            except OSError:
+                pass
+        self.vpn.cancel()
+        self.vpn.disconnect(_quit=False)
+
+    def _read_loop(self, sock: socket.socket, lines: LineBuffer, decoder: codecs.IncrementalDecoder) -> None:
+        """Read lines from upstream, broadcasting notifications and collecting command responses.
+        `decoder` holds any multi-byte character split across reads.
+        """
+        error: Optional[Exception] = None
+        try:
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                for line in lines.feed(decoder.decode(data)):
+                    self._handle_line(line + "\n")
+        except OSError as e:
+            error = e
+        except (errors.BufferOverflowError, UnicodeDecodeError) as e:
+            logger.warning("Dropping upstream connection to %s: %s", self.vpn.mgmt_address, e)
+            error = e
+        logger.debug("Upstream connection to %s closed", self.vpn.mgmt_address)
+        with self._state_lock:
+            if self._upstream is not sock:
+                # Closed deliberately, whoever closed it has dealt with any pending command
+                return
+            self._upstream = None
+            pending, self._pending = self._pending, None
+        # Disconnect before failing the command, so a retry doesn't have its new connection closed from under it
+        self.vpn.disconnect(_quit=False)
+        if pending is not None and not pending.future.done():
+            if isinstance(error, errors.VPNError):
+                pending.future.set_exception(error)
+            else:
+                pending.future.set_exception(errors.ConnectError(str(error or "Upstream connection closed.")))
+
+    def _handle_line(self, line: str) -> None:
+        if is_notification(line):
+            self.broadcast(line)
+            return
+        with self._state_lock:
+            pending = self._pending
+            if pending is None:
+                logger.warning("Discarding unexpected line from upstream: %r", line)
+                return
+            if not pending.add_line(line):
+                return
+            self._pending = None
+        pending.future.set_result("".join(pending.lines))
+
+    def execute(self, cmd: str) -> str:
+        """Run a command upstream and return the raw response, coalescing identical concurrent read-only commands.
+        Multi-line commands are passed as a single string including their input lines and `END` line.
+        Failing to connect or send upstream raises ConnectError and resets the upstream connection.
+        """
+        cmd = cmd.strip()
+        with self._state_lock:
+            shared = self._inflight.get(cmd)
+            if shared is None:
+                pending = _PendingCommand(cmd)
+                if cmd in self.coalesce:
+                    self._inflight[cmd] = pending
+            else:
+                self.coalesced_commands += 1
+        if shared is not None:
+            # The upstream connection may be busy with another client's command, so it's left alone on timeout
+            return self._wait(shared, reset_upstream=False)
+        try:
+            with self._command_lock:
+                try:
+                    self._ensure_upstream()
+                    with self._state_lock:
+                        self._pending = pending
+                    self.upstream_commands += 1
+                    logger.debug("Proxying cmd: %r", cmd)
+                    self.vpn._socket_send(cmd + "\n")
+                except errors.VPNError:
+                    self._close_upstream(quit_=False)
+                    raise
+                except (OSError, AssertionError) as e:
+                    # Connection failed or is broken, start afresh on the next command
+                    self._close_upstream(quit_=False)
+                    raise errors.ConnectError(str(e) or e.__class__.__name__) from None
+                return self._wait(pending)
+        except Exception as e:
+            if not pending.future.done():
+                pending.future.set_exception(e)
+            raise
+        finally:
+            with self._state_lock:
+                if self._inflight.get(cmd) is pending:
+                    del self._inflight[cmd]
+                if self._pending is pending:
+                    self._pending = None
+
+    def _wait(self, pending: _PendingCommand, reset_upstream: bool = True) -> str:
+        """Wait for the response to a command.
+        `reset_upstream` must only be set by the holder of the command lock, whose command is the one in flight.
+        """
+        try:
+            return pending.future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            if reset_upstream:
+                # The rest of the response would be read as the response to the next command, start afresh instead
+                self._close_upstream(quit_=False)
+            raise errors.CommandTimeoutError(f"Timed out waiting for response from {self.vpn.mgmt_address}.") from None
+
+    # Downstream server
+
+    def start(self) -> None:
+        """Start listening for downstream clients, replacing any stale socket file."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = _ProxyServer(self.path, self)
+
+    def serve_forever(self) -> None:
+        """Listen for and serve downstream clients until `shutdown` is called."""
+        if self._server is None:
+            self.start()
+        assert self._server is not None
+        self._serving.set()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._serving.clear()
+
+    def shutdown(self) -> None:
+        """Stop serving, disconnecting all clients and the upstream connection."""
+        if self._server is not None:
+            if self._serving.is_set():
+                self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        with self._clients_lock:
+            clients, self._clients = self._clients, set()
+        for client in clients:
+            client.close()
+        self._close_upstream()
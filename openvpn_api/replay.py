@@ -0,0 +1,249 @@
+"""Record management interface sessions and replay them from a fake management interface.
+
+A `RecordingVPN` behaves exactly like a `VPN`, additionally writing everything sent to and received from the
+management interface, with timings, to a session file as it happens. A `ReplayServer` then serves the session back
+over a TCP or unix socket at the recorded speed or faster, so parsers and transport can be exercised and benchmarked
+against real traffic without a real OpenVPN daemon.
+
+Session files are newline-delimited JSON, each line being one event:
+
+    {"t": 0.0, "dir": "connect", "data": ""}
+    {"t": 0.0012, "dir": "recv", "data": ">INFO:OpenVPN Management Interface Version 1\\r\\n"}
+    {"t": 0.5, "dir": "send", "data": "status 1\\n"}
+    ...
+
+`t` is seconds since recording started and `dir` is one of `connect` (a new connection was opened), `send` (data sent
+by the client) or `recv` (data received from the management interface).
+
+Example usage:
+
+    recorder = SessionRecorder("session.ndjson")
+    vpn = RecordingVPN("localhost", 7505, recorder=recorder)
+    with vpn.connection():
+        vpn.get_status()
+    recorder.close()
+
+    with ReplayServer(load_session("session.ndjson"), speed=10) as server:
+        vpn = server.vpn()
+        with vpn.connection():
+            vpn.get_status()
+"""
+
+import io
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, IO, Iterable, List, Optional, Tuple, Union
+
+from openvpn_api.vpn import VPN
+
+CONNECT = "connect"
+SEND = "send"
+RECV = "recv"
+
+# (seconds since start of recording, direction, data)
+Event = Tuple[float, str, str]
+
+
+class SessionRecorder:
+    """Write session events to a file as they happen."""
+
+    def __init__(self, file: Union[str, IO[str]]) -> None:
+        self._own_file = isinstance(file, str)
+        self._file: IO[str] = open(file, "w", encoding="utf-8") if isinstance(file, str) else file
+        self._lock = threading.Lock()
+        self._started: Optional[float] = None
+        self.events: int = 0
+
+    def record(self, direction: str, data: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._started is None:
+                self._started = now
+            self._file.write(json.dumps({"t": round(now - self._started, 6), "dir": direction, "data": data}) + "\n")
+            self._file.flush()
+            self.events += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._own_file:
+                self._file.close()
+
+    def __enter__(self) -> "SessionRecorder":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def load_session(file: Union[str, IO[str]]) -> List[Event]:
+    """Load the events of a recorded session."""
+    if isinstance(file, str):
+        with open(file, encoding="utf-8") as f:
+            return load_session(f)
+    events = []
+    for line in file:
+        if not line.strip():
+            continue
+        event = json.loads(line)
+        events.append((float(event["t"]), event["dir"], event["data"]))
+    return events
+
+
+def save_session(events: Iterable[Event], file: Union[str, IO[str]]) -> None:
+    """Write session events to a file, e.g. to save a synthesised session."""
+    if isinstance(file, str):
+        with open(file, "w", encoding="utf-8") as f:
+            return save_session(events, f)
+    for t, direction, data in events:
+        file.write(json.dumps({"t": t, "dir": direction, "data": data}) + "\n")
+
+
+class RecordingVPN(VPN):
+    """VPN which records all traffic to and from the management interface."""
+
+    def __init__(self, *args: Any, recorder: SessionRecorder, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.recorder: SessionRecorder = recorder
+
+    def connect(self, timeout: Optional[float] = None) -> Optional[bool]:
+        # Close any existing connection first, so its `quit` is recorded as part of it rather than the new connection
+        self.disconnect()
+        self.recorder.record(CONNECT, "")
+        return super().connect(timeout)
+
+    def _socket_send(self, data) -> None:
+        super()._socket_send(data)
+        self.recorder.record(SEND, data)
+
+    def _socket_recv(self) -> str:
+        data = super()._socket_recv()
+        if data:
+            self.recorder.record(RECV, data)
+        return data
+
+
+def split_connections(events: Iterable[Event]) -> List[List[Event]]:
+    """Split session events into the events of each connection."""
+    connections: List[List[Event]] = []
+    for event in events:
+        if event[1] == CONNECT or not connections:
+            connections.append([])
+        if event[1] != CONNECT:
+            connections[-1].append(event)
+    return [connection for connection in connections if connection]
+
+
+class _ReplayHandler(socketserver.StreamRequestHandler):
+    server: "_ReplayTCPServer"
+
+    def handle(self) -> None:
+        self.server.replay.serve_connection(self.request, self.rfile)
+
+
+class _ReplayTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    replay: "ReplayServer"
+
+
+class _ReplayUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    replay: "ReplayServer"
+
+
+class ReplayServer:
+    """Fake management interface which replays recorded sessions to clients.
+
+    Each connection accepted is served the next recorded connection in the session, cycling back to the first once
+    all have been served. Replies are sent with the recorded delay after the client's command arrives, divided by
+    `speed`; a speed of 0 replays as fast as possible. Commands sent by the client are not checked against the
+    recording, each line received simply moves the replay on to the next recorded response.
+    """
+
+    def __init__(
+        self,
+        events: Iterable[Event],
+        unix_socket: Optional[str] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        speed: float = 1.0,
+    ) -> None:
+        self.connections: List[List[Event]] = split_connections(events)
+        if not self.connections:
+            raise ValueError("Session has no events to replay")
+        self.unix_socket: Optional[str] = unix_socket
+        self.host: str = host
+        self.port: int = port
+        self.speed: float = speed
+        self._server: Optional[socketserver.BaseServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Number of connections accepted so far
+        self.served: int = 0
+
+    def serve_connection(self, sock: socket.socket, rfile: io.BufferedIOBase) -> None:
+        with self._lock:
+            events = self.connections[self.served % len(self.connections)]
+            self.served += 1
+        base_real = time.monotonic()
+        base_recorded = events[0][0]
+        try:
+            for t, direction, data in events:
+                if direction == SEND:
+                    # Wait for the client's command, replies are then timed relative to when it arrived
+                    for _ in range(max(1, data.count("\n"))):
+                        if not rfile.readline():
+                            return
+                    base_real = time.monotonic()
+                    base_recorded = t
+                elif direction == RECV:
+                    if self.speed:
+                        delay = (t - base_recorded) / self.speed - (time.monotonic() - base_real)
+                        if delay > 0:
+                            time.sleep(delay)
+                    sock.sendall(data.encode("utf-8"))
+        except OSError:
+            pass
+
+    def start(self) -> "ReplayServer":
+        """Start serving in a background thread."""
+        server: Union[_ReplayTCPServer, _ReplayUnixServer]
+        if self.unix_socket is not None:
+            if os.path.exists(self.unix_socket):
+                os.unlink(self.unix_socket)
+            server = _ReplayUnixServer(self.unix_socket, _ReplayHandler)
+        else:
+            server = _ReplayTCPServer((self.host, self.port), _ReplayHandler)
+            self.port = server.server_address[1]
+        server.replay = self
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.unix_socket is not None and os.path.exists(self.unix_socket):
+            os.unlink(self.unix_socket)
+
+    def vpn(self, **kwargs: Any) -> VPN:
+        """Create a VPN object pointing at this server."""
+        if self.unix_socket is not None:
+            return VPN(unix_socket=self.unix_socket, **kwargs)
+        return VPN(host=self.host, port=self.port, **kwargs)
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
@@ -0,0 +1,281 @@
+"""Adaptive polling of many OpenVPN management interfaces.
+
+Rather than polling every server at a fixed interval, each server's interval is adjusted based on what the last poll
+found. Servers whose client count or traffic is changing are polled more often, idle servers are backed off towards
+`max_interval` (which bounds how stale any server's data can get) and failing or slow servers are backed off so they
+don't eat into the polling budget of healthy ones.
+
+Example usage:
+
+    poller = AdaptivePoller([VPN("vpn1", 7505), VPN("vpn2", 7505)], callback=print)
+    poller.run()
+"""
+
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from openvpn_api.models.stats import ServerStats
+from openvpn_api.util import errors
+from openvpn_api.vpn import VPN
+
+logger = logging.getLogger(__name__)
+
+# Exceptions which indicate a failed poll of a single server rather than a bug
+POLL_ERRORS = (errors.VPNError, OSError, AssertionError, ValueError)
+
+# Called after every poll with the VPN polled and either the stats fetched or the exception raised
+PollCallback = Callable[[VPN, Optional[ServerStats], Optional[Exception]], None]
+
+
+def _disconnect(vpn: VPN, quit_: bool = True) -> None:
+    """Disconnect from management interface, ignoring any errors raised while doing so."""
+    try:
+        vpn.disconnect(_quit=quit_)
+    except POLL_ERRORS:
+        vpn.disconnect(_quit=False)
+
+
+class PollTarget:
+    """Scheduling state for a single management interface."""
+
+    def __init__(self, vpn: VPN, interval: float) -> None:
+        self.vpn: VPN = vpn
+        # Current poll interval in seconds, before jitter
+        self.interval: float = interval
+        # Monotonic time the next poll is due
+        self.next_poll: float = 0.0
+        self.last_stats: Optional[ServerStats] = None
+        self.last_poll: Optional[float] = None
+        # Exponentially weighted moving averages of poll latency (seconds) and error rate (0-1)
+        self.latency: Optional[float] = None
+        self.error_rate: float = 0.0
+        self.consecutive_errors: int = 0
+        self.polls: int = 0
+        self.removed: bool = False
+        # Set while a poll of this target is running
+        self.in_flight: bool = False
+
+    def __repr__(self) -> str:
+        return (
+            f"<PollTarget vpn='{self.vpn.mgmt_address}', interval={self.interval:.1f}, "
+            f"error_rate={self.error_rate:.2f}>"
+        )
+
+
+class AdaptivePoller:
+    """Poll `VPN.get_stats` on many management interfaces, adapting each server's poll interval.
+
+    Due servers are kept in a priority queue ordered by when their next poll is due and at most `max_concurrency`
+    polls are in flight at once across all servers. Connections are kept open between polls.
+    """
+
+    def __init__(
+        self,
+        vpns: Iterable[VPN] = (),
+        callback: Optional[PollCallback] = None,
+        min_interval: float = 5.0,
+        max_interval: float = 300.0,
+        initial_interval: Optional[float] = None,
+        max_concurrency: int = 8,
+        jitter: float = 0.1,
+        speedup: float = 0.5,
+        slowdown: float = 1.5,
+        error_backoff: float = 2.0,
+        idle_byte_rate: float = 1024.0,
+        latency_factor: float = 10.0,
+        smoothing: float = 0.3,
+        clock: Callable[[], float] = time.monotonic,
+        rand: Callable[[float, float], float] = random.uniform,
+    ) -> None:
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Must have 0 < min_interval <= max_interval")
+        self.callback: Optional[PollCallback] = callback
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = min_interval if initial_interval is None else initial_interval
+        self.max_concurrency = max(1, max_concurrency)
+        # Fraction of the interval to randomly add or subtract so polls of many servers don't synchronise
+        self.jitter = jitter
+        # Multipliers applied to the interval when a server is busy, idle or failing respectively
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.error_backoff = error_backoff
+        # Traffic below this many bytes/second in both directions with no change in client count is considered idle
+        self.idle_byte_rate = idle_byte_rate
+        # Never poll a server more often than this multiple of how long it takes to respond
+        self.latency_factor = latency_factor
+        # Weight given to the latest sample in latency and error rate moving averages
+        self.smoothing = smoothing
+        self._clock = clock
+        self._rand = rand
+
+        self._targets: Dict[int, PollTarget] = {}
+        self._queue: List[Tuple[float, int, PollTarget]] = []
+        self._counter = itertools.count()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        for vpn in vpns:
+            self.add(vpn)
+
+    @property
+    def targets(self) -> List[PollTarget]:
+        """Scheduling state of all servers being polled."""
+        with self._cond:
+            return list(self._targets.values())
+
+    def add(self, vpn: VPN) -> PollTarget:
+        """Start polling a management interface, the first poll is due immediately."""
+        with self._cond:
+            if id(vpn) in self._targets:
+                return self._targets[id(vpn)]
+            target = PollTarget(vpn, self.initial_interval)
+            target.next_poll = self._clock()
+            self._targets[id(vpn)] = target
+            self._push(target)
+            self._cond.notify_all()
+            return target
+
+    def remove(self, vpn: VPN) -> None:
+        """Stop polling a management interface, any poll already in flight is allowed to finish.
+        The connection is closed now if idle, otherwise once the poll in flight finishes.
+        """
+        with self._cond:
+            target = self._targets.pop(id(vpn), None)
+            if target is None:
+                return
+            target.removed = True
+            idle = not target.in_flight
+        if idle:
+            _disconnect(vpn)
+
+    def _push(self, target: PollTarget) -> None:
+        heapq.heappush(self._queue, (target.next_poll, next(self._counter), target))
+
+    def _pop_due(self, now: float) -> Optional[PollTarget]:
+        """Pop the most overdue target if it is due and there is budget to poll it."""
+        while self._queue and self._in_flight < self.max_concurrency:
+            due, _, target = self._queue[0]
+            if target.removed:
+                heapq.heappop(self._queue)
+                continue
+            if due > now:
+                return None
+            heapq.heappop(self._queue)
+            self._in_flight += 1
+            target.in_flight = True
+            return target
+        return None
+
+    def next_due(self) -> Optional[float]:
+        """Monotonic time the next poll is due, or None if nothing is scheduled."""
+        with self._cond:
+            while self._queue and self._queue[0][2].removed:
+                heapq.heappop(self._queue)
+            return self._queue[0][0] if self._queue else None
+
+    def poll(self, target: PollTarget) -> None:
+        """Poll a single target, reschedule it and report the result."""
+        stats: Optional[ServerStats] = None
+        error: Optional[Exception] = None
+        started = self._clock()
+        try:
+            if not target.vpn.is_connected:
+                target.vpn.connect()
+            stats = target.vpn.get_stats()
+        except Exception as e:
+            if not isinstance(e, POLL_ERRORS):
+                logger.exception("Unexpected error polling %s", target.vpn.mgmt_address)
+            error = e
+            _disconnect(target.vpn, quit_=False)
+        finally:
+            # Always release the concurrency budget and reschedule, or the server would never be polled again
+            finished = self._clock()
+            with self._cond:
+                self._in_flight = max(0, self._in_flight - 1)
+                target.in_flight = False
+                self._reschedule(target, stats, error, finished - started, finished)
+                removed = target.removed
+                self._cond.notify_all()
+            if removed:
+                _disconnect(target.vpn)
+        if self.callback is not None:
+            try:
+                self.callback(target.vpn, stats, error)
+            except Exception:  # Don't let a broken callback kill the poller
+                logger.exception("Poll callback raised for %s", target.vpn.mgmt_address)
+
+    def _is_busy(self, target: PollTarget, stats: ServerStats, now: float) -> bool:
+        """Determine if stats have changed enough since the last poll to warrant polling more often."""
+        last = target.last_stats
+        if last is None or target.last_poll is None:
+            return True
+        if stats.client_count != last.client_count:
+            return True
+        elapsed = now - target.last_poll
+        for current, previous in ((stats.bytes_in, last.bytes_in), (stats.bytes_out, last.bytes_out)):
+            if current is None or previous is None:
+                continue
+            if current < previous:
+                # Counter reset, server has probably restarted
+                return True
+            if elapsed > 0 and (current - previous) / elapsed > self.idle_byte_rate:
+                return True
+        return False
+
+    def _reschedule(
+        self, target: PollTarget, stats: Optional[ServerStats], error: Optional[Exception], latency: float, now: float
+    ) -> None:
+        """Update target's moving averages and interval from the outcome of a poll and queue its next poll."""
+        alpha = self.smoothing
+        target.polls += 1
+        target.error_rate = (1 - alpha) * target.error_rate + alpha * (1.0 if error else 0.0)
+        if error is not None or stats is None:
+            target.consecutive_errors += 1
+            target.interval *= self.error_backoff
+        else:
+            target.consecutive_errors = 0
+            target.latency = latency if target.latency is None else (1 - alpha) * target.latency + alpha * latency
+            target.interval *= self.speedup if self._is_busy(target, stats, now) else self.slowdown
+            target.last_stats = stats
+            target.last_poll = now
+        interval = max(target.interval, self.min_interval, (target.latency or 0.0) * self.latency_factor)
+        target.interval = min(interval, self.max_interval)
+        jitter = self._rand(-self.jitter, self.jitter) * target.interval if self.jitter else 0.0
+        target.next_poll = now + max(0.0, target.interval + jitter)
+        if not target.removed:
+            self._push(target)
+
+    def run(self, executor: Optional[concurrent.futures.Executor] = None) -> None:
+        """Poll servers as they become due until `stop` is called."""
+        own_executor = executor is None
+        pool = executor or concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency)
+        try:
+            while not self._stopped.is_set():
+                with self._cond:
+                    target = self._pop_due(self._clock())
+                    if target is None:
+                        due = self.next_due()
+                        timeout = None if due is None else max(0.0, due - self._clock())
+                        if self._in_flight >= self.max_concurrency:
+                            timeout = None
+                        self._cond.wait(timeout if timeout is None else min(timeout, 1.0))
+                        continue
+                pool.submit(self.poll, target)
+        finally:
+            if own_executor:
+                pool.shutdown(wait=True)
+            for target in self.targets:
+                _disconnect(target.vpn)
+
+    def stop(self) -> None:
+        """Stop a running poller."""
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
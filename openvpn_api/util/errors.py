@@ -10,5 +10,25 @@ class ConnectError(VPNError):
     """Exception raised on connection failure."""
 
 
+class CircuitOpenError(ConnectError):
+    """Exception raised instead of connecting to an endpoint whose circuit breaker is open."""
+
+
+class BufferOverflowError(VPNError):
+    """Exception raised if data received from the management interface exceeds a configured limit.
+    The connection is closed when this is raised.
+    """
+
+
 class ParseError(VPNError):
     """Exception for all management interface parsing errors."""
+
+
+class CommandTimeoutError(VPNError):
+    """Exception raised if the management interface does not respond to a command in time.
+    The connection is closed when this is raised.
+    """
+
+
+class CommandCancelledError(VPNError):
+    """Exception raised if a command is aborted by `VPN.cancel` before its response arrived."""
@@ -0,0 +1,55 @@
+"""Framing of the management interface's line based protocol.
+
+Command responses are either a single `SUCCESS:` or `ERROR:` line, or any number of lines terminated by an `END` line.
+Real-time notifications are single lines starting with `>` and can arrive at any time, including part way through a
+command response.
+"""
+
+from typing import List, Optional
+
+from openvpn_api.util import errors
+
+
+def is_notification(line: str) -> bool:
+    """Test if `line` is a real-time notification rather than part of a command response."""
+    return line.startswith(">")
+
+
+def is_response_end(line: str, first: bool) -> bool:
+    """Test if `line` is the last line of a command response, `first` being whether it is the response's first line."""
+    stripped = line.strip()
+    if stripped == "END":
+        return True
+    return first and (stripped.startswith("SUCCESS:") or stripped.startswith("ERROR:"))
+
+
+class LineBuffer:
+    """Accumulate data received from the management interface and split it into complete lines.
+
+    Lines are returned without their trailing line feed, any incomplete line is held until the rest of it arrives.
+    An incomplete line growing beyond `max_length` characters raises BufferOverflowError, as the management interface
+    never sends lines anywhere near that long.
+    """
+
+    def __init__(self, max_length: Optional[int] = None) -> None:
+        self.partial: str = ""
+        self.max_length: Optional[int] = max_length
+
+    def feed(self, data: str) -> List[str]:
+        """Add received data, returning any lines it completes."""
+        if "\n" not in data:
+            self.partial += data
+            lines = []
+        else:
+            lines = (self.partial + data).split("\n")
+            self.partial = lines.pop()
+        if self.max_length is not None and len(self.partial) > self.max_length:
+            self.partial = ""
+            raise errors.BufferOverflowError(f"Received a line longer than {self.max_length} characters.")
+        return lines
+
+    def clear(self) -> None:
+        self.partial = ""
+
+    def __len__(self) -> int:
+        return len(self.partial)
@@ -1,16 +1,21 @@
+import codecs
+import collections
 import contextlib
 import logging
 import re
 import socket
+import time
 from enum import Enum
-from typing import Optional, Generator
+from typing import Callable, Deque, Dict, Generator, List, Optional
 
 import openvpn_status
 from openvpn_status.models import Status
 
+from openvpn_api.health import EndpointHealth
 from openvpn_api.models.state import State
 from openvpn_api.models.stats import ServerStats
 from openvpn_api.util import errors
+from openvpn_api.util.protocol import LineBuffer, is_notification, is_response_end
 
 logger = logging.getLogger(__name__)
 
@@ -20,8 +25,30 @@ class VPNType(str, Enum):
     UNIX_SOCKET = "socket"
 
 
+class OverflowPolicy(str, Enum):
+    """What to do when a bounded queue is full and another item arrives."""
+
+    DROP_OLDEST = "drop-oldest"
+    DROP_NEWEST = "drop-newest"
+    # Close the connection and raise BufferOverflowError
+    ERROR = "error"
+
+
 class VPN:
-    def __init__(self, host: str = None, port: int = None, unix_socket: str = None):
+    def __init__(
+        self,
+        host: str = None,
+        port: int = None,
+        unix_socket: str = None,
+        connect_timeout: Optional[float] = 3.0,
+        read_timeout: Optional[float] = 3.0,
+        timeout: Optional[float] = None,
+        health: Optional[EndpointHealth] = None,
+        on_notification: Optional[Callable[[str], None]] = None,
+        max_notifications: int = 1000,
+        overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        max_line_length: Optional[int] = 65536,
+    ):
         if (unix_socket and host) or (unix_socket and port) or (not unix_socket and not host and not port):
             raise errors.VPNError("Must specify either socket or host and port")
 
@@ -30,6 +57,37 @@ class VPN:
         self._mgmt_port: Optional[int] = port
         self._socket: Optional[socket.socket] = None
 
+        # Seconds to wait for the socket to connect and the management interface to greet us
+        self.connect_timeout: Optional[float] = connect_timeout
+        # Seconds to wait for each read from the socket
+        self.read_timeout: Optional[float] = read_timeout
+        # Seconds allowed in total for each command's full response to arrive
+        self.timeout: Optional[float] = timeout
+        # Monotonic time by which all commands must complete, set by deadline()
+        self._deadline: Optional[float] = None
+        # Set when a command in progress is aborted by cancel()
+        self._cancelled: bool = False
+
+        # Circuit breaker and failure stats for this endpoint, if tracking is enabled
+        self.health: Optional[EndpointHealth] = health
+
+        # Multi-byte characters split across reads are held here until the rest of them arrives
+        self._decoder: codecs.IncrementalDecoder = codecs.getincrementaldecoder("utf-8")()
+        # Data received but not yet split into complete lines, limited to max_line_length characters
+        self._lines: LineBuffer = LineBuffer(max_line_length)
+        # Real-time notifications received while reading command responses are passed to on_notification if set,
+        # otherwise queued here until read with read_notifications(), up to max_notifications after which `overflow`
+        # decides what is dropped
+        self.on_notification: Optional[Callable[[str], None]] = on_notification
+        self.notifications: Deque[str] = collections.deque()
+        self.max_notifications: int = max_notifications
+        self.overflow: OverflowPolicy = OverflowPolicy(overflow)
+
+        # Resource accounting, see resource_usage()
+        self._queued_bytes: int = 0
+        self.notifications_dropped: int = 0
+        self.connects: int = 0
+
         # Release info cache
         self._release: Optional[str] = None
 
@@ -52,35 +110,113 @@ class VPN:
         else:
             return str(self._mgmt_socket)
 
-    def connect(self) -> Optional[bool]:
+    def connect(self, timeout: Optional[float] = None) -> Optional[bool]:
         """Connect to management interface socket.
+        `timeout` overrides the connect timeout set on this VPN for this call only.
+        If health tracking is enabled and the endpoint's circuit is open, raises CircuitOpenError without connecting.
+        Raises CommandTimeoutError without connecting if the deadline set by deadline() has already passed.
+        Any existing connection is closed first.
         """
+        timeout = self._remaining(self.connect_timeout if timeout is None else timeout, self._deadline)
+        if timeout is not None and timeout <= 0:
+            raise errors.CommandTimeoutError(f"Deadline exceeded before connecting to {self.mgmt_address}.")
+        if self.health is not None and not self.health.allow_request():
+            raise errors.CircuitOpenError(f"Not connecting to {self.mgmt_address}, endpoint is marked unhealthy.")
+        # Don't leak the socket of an existing connection
+        self.disconnect()
+        self._cancelled = False
+        self._decoder.reset()
+        started = time.monotonic()
         try:
             if self.type == VPNType.IP:
                 assert self._mgmt_host is not None and self._mgmt_port is not None
-                self._socket = socket.create_connection((self._mgmt_host, self._mgmt_port), timeout=3)
+                self._socket = socket.create_connection((self._mgmt_host, self._mgmt_port), timeout=timeout)
             elif self.type == VPNType.UNIX_SOCKET:
                 assert self._mgmt_socket is not None
                 self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._socket.settimeout(timeout)
                 self._socket.connect(self._mgmt_socket)
             else:
                 raise ValueError("Invalid connection type")
 
             resp = self._socket_recv()
             assert resp.startswith(">INFO"), "Did not get expected response from interface when opening socket."
-            return True
+            self._lines.clear()
+            if "\n" in resp:
+                # Anything received after the greeting is the start of the notification stream
+                for line in self._lines.feed(resp)[1:]:
+                    self._route_line(line)
         except (socket.timeout, socket.error) as e:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+            if self.health is not None:
+                self.health.record_failure(e)
             raise errors.ConnectError(str(e)) from None
+        except errors.ConnectError as e:
+            # Invalid data received, the connection has already been closed
+            if self.health is not None:
+                self.health.record_failure(e)
+            raise
+        except AssertionError as e:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+            if self.health is not None:
+                self.health.record_failure(e)
+            raise
+        self.connects += 1
+        if self.health is not None:
+            self.health.record_connect(time.monotonic() - started)
+        return True
 
     def disconnect(self, _quit=True) -> None:
         """Disconnect from management interface socket.
         By default will issue the `quit` command to inform the management interface we are closing the connection
         """
         if self._socket is not None:
-            if _quit:
-                self._socket_send("quit\n")
-            self._socket.close()
-            self._socket = None
+            try:
+                if _quit:
+                    self._socket_send("quit\n")
+            except socket.error:
+                # Connection already broken, closing it is all that's left to do
+                pass
+            finally:
+                self._socket.close()
+                self._socket = None
+                self._lines.clear()
+                self._decoder.reset()
+
+    def reconnect(self, timeout: Optional[float] = None) -> Optional[bool]:
+        """Close the connection, if open, and connect afresh.
+        Cached data is cleared as the daemon may have been restarted in between. Notifications already queued are kept.
+        """
+        self.disconnect()
+        self.clear_cache()
+        return self.connect(timeout)
+
+    @property
+    def reconnects(self) -> int:
+        """Number of times this VPN has connected to the management interface after its first connection.
+        """
+        return max(0, self.connects - 1)
+
+    @property
+    def buffered_bytes(self) -> int:
+        """Characters held in memory by this VPN, from incomplete lines and queued notifications.
+        """
+        return len(self._lines) + self._queued_bytes
+
+    def resource_usage(self) -> Dict[str, int]:
+        """Get counters of the resources held and events seen by this VPN, e.g. to export as metrics.
+        """
+        return {
+            "buffered_bytes": self.buffered_bytes,
+            "notifications_queued": len(self.notifications),
+            "notifications_dropped": self.notifications_dropped,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+        }
 
     @property
     def is_connected(self) -> bool:
@@ -98,32 +234,227 @@ class VPN:
         finally:
             self.disconnect()
 
+    @contextlib.contextmanager
+    def deadline(self, seconds: float) -> Generator:
+        """Create context in which all connects and commands must complete within `seconds` in total.
+        Nested deadlines can only shorten the time allowed, never extend it.
+        """
+        previous = self._deadline
+        deadline = time.monotonic() + seconds
+        self._deadline = deadline if previous is None else min(previous, deadline)
+        try:
+            yield
+        finally:
+            self._deadline = previous
+
+    def cancel(self) -> None:
+        """Abort any command in progress from another thread.
+        The command raises CommandCancelledError and the connection is closed.
+        """
+        sock = self._socket
+        if sock is not None:
+            self._cancelled = True
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    @staticmethod
+    def _remaining(timeout: Optional[float], deadline: Optional[float]) -> Optional[float]:
+        """Shorten timeout to the time remaining until deadline, if there is one.
+        """
+        if deadline is None:
+            return timeout
+        remaining = max(0.0, deadline - time.monotonic())
+        return remaining if timeout is None else min(timeout, remaining)
+
     def _socket_send(self, data) -> None:
         """Convert data to bytes and send to socket.
         """
         if self._socket is None:
             raise errors.NotConnectedError("You must be connected to the management interface to issue commands.")
-        self._socket.send(bytes(data, "utf-8"))
+        self._socket.sendall(bytes(data, "utf-8"))
 
     def _socket_recv(self) -> str:
         """Receive bytes from socket and convert to string.
+        Returns an empty string only if the connection was closed. Receiving invalid UTF-8 closes the connection and
+        raises ConnectError.
         """
         if self._socket is None:
             raise errors.NotConnectedError("You must be connected to the management interface to issue commands.")
-        return self._socket.recv(4096).decode("utf-8")
+        while True:
+            data = self._socket.recv(4096)
+            try:
+                text = self._decoder.decode(data, final=not data)
+            except UnicodeDecodeError as e:
+                self.disconnect(_quit=False)
+                raise errors.ConnectError(f"Invalid data received from {self.mgmt_address}: {e}") from None
+            # Only the start of a multi-byte character arrived, wait for the rest of it
+            if text or not data:
+                return text
 
-    def send_command(self, cmd) -> str:
+    def _send_before(self, data: str, deadline: Optional[float]) -> None:
+        """Send to socket, waiting no longer than the read timeout or until deadline for the data to be accepted.
+        On failure the connection is closed, as its state is unknown.
+        """
+        timeout = self._remaining(self.read_timeout, deadline)
+        if timeout is not None and timeout <= 0:
+            self.disconnect(_quit=False)
+            raise errors.CommandTimeoutError(f"Deadline exceeded sending command to {self.mgmt_address}.")
+        if self._socket is not None:
+            self._socket.settimeout(timeout)
+        try:
+            self._socket_send(data)
+        except socket.timeout:
+            self.disconnect(_quit=False)
+            raise errors.CommandTimeoutError(f"Timed out sending command to {self.mgmt_address}.") from None
+        except socket.error as e:
+            cancelled = self._cancelled
+            self.disconnect(_quit=False)
+            if cancelled:
+                raise errors.CommandCancelledError("Command cancelled.") from None
+            raise errors.ConnectError(str(e)) from None
+
+    def _recv_before(self, deadline: Optional[float]) -> str:
+        """Receive from socket, waiting no longer than the read timeout or until deadline.
+        On timeout or end of stream the connection is closed, as any further response would otherwise be read as
+        the response to the next command.
+        """
+        timeout = self._remaining(self.read_timeout, deadline)
+        if timeout is not None and timeout <= 0:
+            self.disconnect(_quit=False)
+            raise errors.CommandTimeoutError(f"Deadline exceeded waiting for response from {self.mgmt_address}.")
+        if self._socket is not None:
+            self._socket.settimeout(timeout)
+        try:
+            data = self._socket_recv()
+        except socket.timeout:
+            self.disconnect(_quit=False)
+            raise errors.CommandTimeoutError(f"Timed out waiting for response from {self.mgmt_address}.") from None
+        except socket.error as e:
+            cancelled = self._cancelled
+            self.disconnect(_quit=False)
+            if cancelled:
+                raise errors.CommandCancelledError("Command cancelled.") from None
+            raise errors.ConnectError(str(e)) from None
+        if not data:
+            cancelled = self._cancelled
+            self.disconnect(_quit=False)
+            if cancelled:
+                raise errors.CommandCancelledError("Command cancelled.")
+            raise errors.ConnectError("Connection closed by management interface.")
+        return data
+
+    def _route_notification(self, line: str) -> None:
+        line = line.rstrip("\r")
+        if self.on_notification is not None:
+            try:
+                self.on_notification(line)
+            except Exception:
+                logger.exception("Notification callback failed for %r", line)
+        else:
+            self._queue_notification(line)
+
+    def _queue_notification(self, line: str) -> None:
+        if len(self.notifications) >= self.max_notifications:
+            if self.overflow == OverflowPolicy.ERROR:
+                self.disconnect(_quit=False)
+                raise errors.BufferOverflowError(f"More than {self.max_notifications} notifications queued.")
+            self.notifications_dropped += 1
+            if self.overflow == OverflowPolicy.DROP_NEWEST or not self.notifications:
+                return
+            self._queued_bytes -= len(self.notifications.popleft())
+        self.notifications.append(line)
+        self._queued_bytes += len(line)
+
+    def _drain_notifications(self) -> List[str]:
+        notifications = list(self.notifications)
+        self.notifications.clear()
+        self._queued_bytes = 0
+        return notifications
+
+    def _feed(self, data: str) -> List[str]:
+        """Split received data into complete lines, closing the connection if the line length limit is exceeded.
+        """
+        try:
+            return self._lines.feed(data)
+        except errors.BufferOverflowError:
+            self.disconnect(_quit=False)
+            raise
+
+    def _route_line(self, line: str) -> None:
+        """Route a line received outside of a command response.
+        """
+        if is_notification(line):
+            self._route_notification(line)
+        elif line.strip():
+            logger.warning("Discarding unexpected line from management interface: %r", line)
+
+    def _read_response(self, deadline: Optional[float]) -> str:
+        """Read a full command response, routing any notifications received along the way.
+        Returns the response's lines, with notifications removed.
+        """
+        payload: List[str] = []
+        done = False
+        while not done:
+            for line in self._feed(self._recv_before(deadline)):
+                if done:
+                    # Response already complete, the rest of what was received is notifications
+                    self._route_line(line)
+                elif is_notification(line):
+                    self._route_notification(line)
+                elif payload or line.strip():
+                    payload.append(line)
+                    done = is_response_end(line, len(payload) == 1)
+        return "".join(line + "\n" for line in payload)
+
+    def send_command(self, cmd, timeout: Optional[float] = None) -> str:
         """Send command to management interface and fetch response.
+        `timeout` is the total seconds allowed for the full response to arrive, overriding the timeout set on this VPN
+        for this call only. Raises CommandTimeoutError if it or the read timeout is exceeded.
+        Real-time notifications received while waiting for the response are routed to `on_notification` or the
+        `notifications` queue, so the response returned only contains the command's own output.
         """
+        deadline = self._deadline
+        timeout = self.timeout if timeout is None else timeout
+        if timeout is not None:
+            call_deadline = time.monotonic() + timeout
+            deadline = call_deadline if deadline is None else min(deadline, call_deadline)
         logger.debug("Sending cmd: %r", cmd.strip())
-        self._socket_send(cmd + "\n")
-        resp = self._socket_recv()
-        if cmd.strip() not in ("load-stats", "signal SIGTERM"):
-            while not (resp.strip().endswith("END") or resp.strip().startswith("SUCCESS:")):
-                resp += self._socket_recv()
+        started = time.monotonic()
+        try:
+            self._send_before(cmd + "\n", deadline)
+            resp = self._read_response(deadline)
+        except (errors.CommandTimeoutError, errors.ConnectError) as e:
+            if self.health is not None:
+                self.health.record_failure(e)
+            raise
+        if self.health is not None:
+            self.health.record_success(time.monotonic() - started)
         logger.debug("Cmd response: %r", resp)
         return resp
 
+    def read_notifications(self, timeout: float = 0.0) -> List[str]:
+        """Read real-time notifications, waiting up to `timeout` seconds for any to arrive if none are queued.
+        Returns and clears all queued notifications. Notifications passed to `on_notification` are not queued.
+        """
+        if not self.notifications and self._socket is not None:
+            self._socket.settimeout(timeout)
+            try:
+                data = self._socket_recv()
+            except (socket.timeout, BlockingIOError):
+                data = ""
+            except socket.error as e:
+                self.disconnect(_quit=False)
+                raise errors.ConnectError(str(e)) from None
+            else:
+                if not data:
+                    self.disconnect(_quit=False)
+                    raise errors.ConnectError("Connection closed by management interface.")
+            for line in self._feed(data):
+                self._route_line(line)
+        return self._drain_notifications()
+
     # Interface commands and parsing
 
     def _get_version(self) -> str:
@@ -184,6 +515,13 @@ class VPN:
         raw = self.send_command("load-stats")
         return ServerStats.parse_raw(raw)
 
+    def set_bytecount(self, interval: int) -> None:
+        """Enable real-time `>BYTECOUNT` notifications every `interval` seconds, or disable them if 0.
+        """
+        raw = self.send_command(f"bytecount {interval}")
+        if not raw.strip().startswith("SUCCESS:"):
+            raise errors.ParseError("Did not get expected response after setting bytecount interval.")
+
     def get_status(self) -> Status:
         """Get current status from VPN.
 
@@ -35,6 +35,7 @@ setuptools.setup(
     python_requires=">=3.6",
     install_requires=["openvpn_status",],
     extras_require={"dev": ["nose", "black",],},
+    entry_points={"console_scripts": ["openvpn-api=openvpn_api.cli:main",],},
     project_urls={
         "Source": "https://github.com/Jamie-/openvpn-api",
         "Bug Reports": "https://github.com/Jamie-/openvpn-api/issues",
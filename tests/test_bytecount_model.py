@@ -0,0 +1,128 @@
+import tracemalloc
+import unittest
+
+from openvpn_api.models.bytecount import ByteCountRecorder, ByteCountSeries
+
+
+class TestByteCountSeries(unittest.TestCase):
+    def test_init(self):
+        s = ByteCountSeries(10)
+        self.assertEqual(0, len(s))
+        self.assertIsNone(s.latest)
+        self.assertEqual((0.0, 0.0), s.rate())
+        self.assertEqual("<ByteCountSeries samples=0, capacity=10>", repr(s))
+        with self.assertRaises(ValueError):
+            ByteCountSeries(1)
+
+    def test_ring_buffer(self):
+        s = ByteCountSeries(3)
+        for i in range(5):
+            s.append(i, i * 10, i * 20)
+        self.assertEqual(3, len(s))
+        self.assertEqual((2.0, 20, 40), s.sample(0))
+        self.assertEqual((4.0, 40, 80), s.sample(-1))
+        self.assertEqual((4.0, 40, 80), s.latest)
+        with self.assertRaises(IndexError):
+            s.sample(3)
+        s.clear()
+        self.assertEqual(0, len(s))
+
+    def test_rate(self):
+        s = ByteCountSeries(100)
+        for i in range(11):
+            s.append(1000 + i, i * 100, i * 1000)
+        self.assertEqual((100.0, 1000.0), s.rate())
+        # Window relative to latest sample
+        s.append(1011, 2000, 10000)
+        self.assertEqual((1000.0, 0.0), s.rate(window=1))
+        self.assertEqual((550.0, 500.0), s.rate(window=2))
+        # Window relative to given time
+        self.assertEqual((0.0, 0.0), s.rate(window=5, now=2000))
+
+    def test_rate_counter_reset(self):
+        s = ByteCountSeries(10)
+        s.append(0, 1000, 1000)
+        s.append(1, 1100, 1200)
+        s.append(2, 0, 0)
+        s.append(3, 100, 200)
+        self.assertEqual((100.0, 200.0), s.rate())
+
+    def test_percentile(self):
+        s = ByteCountSeries(10)
+        total = 0
+        for i, delta in enumerate([0, 10, 20, 30, 40, 50]):
+            total += delta
+            s.append(i, total, total * 2)
+        self.assertEqual((10.0, 20.0), s.percentile(0))
+        self.assertEqual((30.0, 60.0), s.percentile(50))
+        self.assertEqual((50.0, 100.0), s.percentile(100))
+        self.assertEqual((45.0, 90.0), s.percentile(50, window=2))
+        with self.assertRaises(ValueError):
+            s.percentile(101)
+
+
+class TestByteCountRecorder(unittest.TestCase):
+    def test_feed_client(self):
+        r = ByteCountRecorder(capacity=10)
+        self.assertTrue(r.feed(">BYTECOUNT:1024,2048\r\n", timestamp=1.0))
+        self.assertTrue(r.feed(">BYTECOUNT:2048,4096", timestamp=2.0))
+        self.assertEqual([None], list(r.series))
+        self.assertEqual((2.0, 2048, 4096), r.series[None].latest)
+        self.assertEqual((1024.0, 2048.0), r.series[None].rate())
+
+    def test_feed_server(self):
+        r = ByteCountRecorder(capacity=10, clock=lambda: 5.0)
+        self.assertTrue(r.feed(">BYTECOUNT_CLI:1,100,200"))
+        self.assertTrue(r.feed(">BYTECOUNT_CLI:2,300,400\r\n"))
+        self.assertEqual((5.0, 300, 400), r.series[2].latest)
+        self.assertFalse(r.feed(">CLIENT:DISCONNECT,1\r\n"))
+        self.assertEqual([2], list(r.series))
+
+    def test_feed_batched(self):
+        # Batches of 5 samples sent a second apart at 1000 bytes/second, each batch read all at once
+        now = [0.0]
+        r = ByteCountRecorder(capacity=100, clock=lambda: now[0], interval=1)
+        total = 0
+        for batch in range(3):
+            now[0] = batch * 5.0 + 4.0
+            for _ in range(5):
+                total += 1000
+                r.feed(f">BYTECOUNT:{total},{total}")
+        self.assertEqual((1000.0, 1000.0), r.series[None].percentile(50))
+        self.assertEqual((1000.0, 1000.0), r.series[None].rate())
+        # Samples read as they arrive keep their own time
+        now[0] = 100.0
+        r.feed(f">BYTECOUNT:{total},{total}")
+        self.assertEqual(100.0, r.series[None].latest[0])
+
+    def test_feed_other(self):
+        r = ByteCountRecorder()
+        self.assertFalse(r.feed(">INFO:OpenVPN Management Interface Version 1"))
+        self.assertFalse(r.feed("SUCCESS: bytecount interval changed"))
+        self.assertEqual({}, r.series)
+        with self.assertRaises(ValueError):
+            r.feed(">BYTECOUNT:asd")
+
+    def test_max_series(self):
+        r = ByteCountRecorder(capacity=10, max_series=2)
+        for cid in range(5):
+            r.feed(f">BYTECOUNT_CLI:{cid},1,1")
+        self.assertEqual([3, 4], list(r.series))
+
+    def test_memory_bounded(self):
+        r = ByteCountRecorder(capacity=100)
+        lines = [f">BYTECOUNT_CLI:{cid},1000,2000" for cid in range(10)]
+        for i in range(200):
+            for line in lines:
+                r.feed(line, timestamp=i)
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            for i in range(200, 2200):
+                for line in lines:
+                    r.feed(line, timestamp=i)
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        growth = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        self.assertLess(growth, 16 * 1024)
@@ -0,0 +1,124 @@
+import csv
+import datetime
+import io
+import json
+import unittest
+from ipaddress import IPv4Address
+from unittest.mock import patch, MagicMock
+
+from openvpn_api import cli
+from openvpn_api.models.state import State
+from openvpn_api.models.stats import ServerStats
+from openvpn_api.util import errors
+from openvpn_api.vpn import VPN, VPNType
+
+
+class TestCLI(unittest.TestCase):
+    def test_parse_endpoint(self):
+        vpn = cli.parse_endpoint("localhost:7505")
+        self.assertEqual(VPNType.IP, vpn.type)
+        self.assertEqual("localhost:7505", vpn.mgmt_address)
+        vpn = cli.parse_endpoint("[::1]:7505")
+        self.assertEqual(VPNType.IP, vpn.type)
+        self.assertEqual("::1:7505", vpn.mgmt_address)
+        vpn = cli.parse_endpoint("/run/openvpn/server.sock")
+        self.assertEqual(VPNType.UNIX_SOCKET, vpn.type)
+        self.assertEqual("/run/openvpn/server.sock", vpn.mgmt_address)
+        vpn = cli.parse_endpoint("localhost:7505", connect_timeout=1, timeout=5)
+        self.assertEqual(1, vpn.connect_timeout)
+        self.assertEqual(5, vpn.timeout)
+
+    @patch("openvpn_api.vpn.VPN.disconnect")
+    @patch("openvpn_api.vpn.VPN.connect")
+    @patch("openvpn_api.vpn.VPN.get_stats")
+    @patch("openvpn_api.vpn.VPN.get_state")
+    def test_query_endpoint(self, mock_get_state, mock_get_stats, mock_connect, mock_disconnect):
+        mock_get_state.return_value = State(
+            datetime.datetime(2019, 6, 16, 21, 13, 21), "CONNECTED", "SUCCESS", IPv4Address("10.0.0.1")
+        )
+        mock_get_stats.return_value = ServerStats(client_count=3, bytes_in=10, bytes_out=20)
+        vpn = VPN(host="localhost", port=1234)
+        mock_connect.side_effect = lambda: setattr(vpn, "_socket", MagicMock())
+        rows = cli.query_endpoint(vpn, ["state", "stats"])
+        mock_connect.assert_called_once()
+        mock_disconnect.assert_called_once_with(_quit=True)
+        self.assertEqual(2, len(rows))
+        self.assertTrue(rows[0]["ok"])
+        self.assertEqual("state", rows[0]["command"])
+        self.assertEqual("localhost:1234", rows[0]["endpoint"])
+        self.assertEqual("CONNECTED", rows[0]["state_name"])
+        self.assertEqual("10.0.0.1", rows[0]["local_virtual_v4_addr"])
+        self.assertEqual("2019-06-16T21:13:21", rows[0]["up_since"])
+        self.assertEqual("stats", rows[1]["command"])
+        self.assertEqual(3, rows[1]["client_count"])
+        self.assertEqual(20, rows[1]["bytes_out"])
+
+    @patch("openvpn_api.vpn.VPN.connect")
+    def test_query_endpoint_error(self, mock_connect):
+        mock_connect.side_effect = errors.ConnectError("Connection refused")
+        vpn = VPN(host="localhost", port=1234)
+        rows = cli.query_endpoint(vpn, ["stats", "state", "version"])
+        # Remaining commands fail with the connect error rather than each trying to connect again
+        mock_connect.assert_called_once()
+        self.assertEqual([False, False, False], [row["ok"] for row in rows])
+        self.assertEqual(["Connection refused"] * 3, [row["error"] for row in rows])
+
+    def test_row_writer_ndjson(self):
+        out = io.StringIO()
+        writer = cli.RowWriter(out, "ndjson", ["stats"])
+        writer.write({"endpoint": "a:1", "command": "stats", "ok": True, "error": None, "client_count": 1})
+        writer.write({"endpoint": "b:1", "command": "stats", "ok": False, "error": "asd"})
+        lines = out.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual(1, json.loads(lines[0])["client_count"])
+        self.assertEqual("asd", json.loads(lines[1])["error"])
+
+    def test_row_writer_csv(self):
+        out = io.StringIO()
+        writer = cli.RowWriter(out, "csv", ["stats", "status"])
+        writer.write({"endpoint": "a:1", "command": "stats", "ok": True, "error": None, "client_count": 1})
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual(
+            list(cli.BASE_FIELDS)
+            + ["client_count", "bytes_in", "bytes_out", "updated_at", "routing_count", "bytes_received", "bytes_sent"],
+            list(rows[0].keys()),
+        )
+        self.assertEqual("1", rows[0]["client_count"])
+        self.assertEqual("", rows[0]["error"])
+
+    @patch("openvpn_api.cli.query_endpoint")
+    def test_run_query_watch(self, mock_query_endpoint):
+        mock_query_endpoint.return_value = [{"ok": True}]
+        writer = MagicMock()
+        sleep = MagicMock()
+        vpns = [VPN(host="localhost", port=1234), VPN(unix_socket="file.sock")]
+        self.assertTrue(cli.run_query(vpns, ["stats"], writer, watch=5, count=3, sleep=sleep))
+        self.assertEqual(6, mock_query_endpoint.call_count)
+        mock_query_endpoint.assert_any_call(vpns[0], ["stats"], True)
+        self.assertEqual(6, writer.write.call_count)
+        self.assertEqual(2, sleep.call_count)
+
+    @patch("openvpn_api.cli.query_endpoint")
+    def test_main(self, mock_query_endpoint):
+        mock_query_endpoint.return_value = [{"ok": False}]
+        with patch("sys.stdout", new_callable=io.StringIO):
+            self.assertEqual(1, cli.main(["query", "-c", "version", "localhost:1234"]))
+        self.assertEqual(["version"], mock_query_endpoint.call_args[0][1])
+        self.assertIsNone(mock_query_endpoint.call_args[0][0].health)
+
+    @patch("openvpn_api.cli.query_endpoint")
+    def test_main_failure_threshold(self, mock_query_endpoint):
+        mock_query_endpoint.return_value = [{"ok": True}]
+        with patch("sys.stdout", new_callable=io.StringIO):
+            argv = ["query", "--watch", "0", "--count", "1", "--failure-threshold", "2", "localhost:1234"]
+            self.assertEqual(0, cli.main(argv))
+        self.assertEqual(2, mock_query_endpoint.call_args[0][0].health.failure_threshold)
+
+    @patch("openvpn_api.cli.ManagementProxy")
+    def test_main_proxy(self, mock_proxy):
+        self.assertEqual(0, cli.main(["proxy", "--listen", "proxy.sock", "/run/openvpn/server.sock"]))
+        vpn, path = mock_proxy.call_args[0]
+        self.assertEqual("/run/openvpn/server.sock", vpn.mgmt_address)
+        self.assertEqual("proxy.sock", path)
+        mock_proxy.return_value.serve_forever.assert_called_once()
+        mock_proxy.return_value.shutdown.assert_called_once()
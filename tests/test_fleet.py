@@ -0,0 +1,155 @@
+import random
+import unittest
+from unittest.mock import MagicMock
+
+import openvpn_status
+
+from openvpn_api.fleet import FleetSummary, _Ranking
+from openvpn_api.models.state import State
+from openvpn_api.models.stats import ServerStats
+
+STATUS = """OpenVPN CLIENT LIST\r
+Updated,Thu Jul 18 20:47:42 2019\r
+Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since\r
+alice,1.2.3.4:12345,1000,2000,Tue Jun 11 21:22:02 2019\r
+bob,5.6.7.8:23456,500,100,Tue Jun 11 21:22:02 2019\r
+ROUTING TABLE\r
+Virtual Address,Common Name,Real Address,Last Ref\r
+GLOBAL STATS\r
+Max bcast/mcast queue length,2\r
+END\r
+"""
+
+
+def state(name):
+    return State.parse_raw(f"1560719601,{name},SUCCESS,10.0.0.1,,,1.2.3.4,1194\r\nEND\r\n")
+
+
+class TestRanking(unittest.TestCase):
+    def test_top(self):
+        ranking = _Ranking()
+        for key, score in (("a", 1), ("b", 5), ("c", 3)):
+            ranking.set(key, score)
+        self.assertEqual([("b", 5), ("c", 3)], ranking.top(2))
+        ranking.set("a", 10)
+        ranking.discard("b")
+        self.assertEqual([("a", 10), ("c", 3)], ranking.top(5))
+        self.assertEqual(2, len(ranking))
+
+    def test_matches_sort(self):
+        rand = random.Random(1)
+        ranking = _Ranking()
+        expected = {}
+        for _ in range(5000):
+            key = rand.randrange(200)
+            if rand.random() < 0.2:
+                ranking.discard(key)
+                expected.pop(key, None)
+            else:
+                score = rand.randrange(1000)
+                ranking.set(key, score)
+                expected[key] = score
+        self.assertEqual(sorted(expected.values(), reverse=True)[:10], [score for _, score in ranking.top(10)])
+        # Stale entries are compacted away rather than accumulating
+        self.assertLess(len(ranking._heap), 2 * len(expected) + 33)
+
+
+class TestFleetSummary(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.summary = FleetSummary(clock=lambda: self.now)
+
+    def test_stats_totals(self):
+        self.summary.update_stats("vpn1", ServerStats(client_count=3, bytes_in=1000, bytes_out=2000))
+        self.summary.update_stats("vpn2", ServerStats(client_count=2, bytes_in=500, bytes_out=500))
+        self.assertEqual((5, 1500, 2500), (self.summary.client_count, self.summary.bytes_in, self.summary.bytes_out))
+        self.assertEqual((0, 0), (self.summary.rate_in, self.summary.rate_out))
+        self.now = 10.0
+        self.summary.update_stats("vpn1", ServerStats(client_count=4, bytes_in=2000, bytes_out=4000))
+        self.assertEqual((6, 2500, 4500), (self.summary.client_count, self.summary.bytes_in, self.summary.bytes_out))
+        self.assertEqual((100, 200), (self.summary.rate_in, self.summary.rate_out))
+        self.assertEqual([("vpn1", 300), ("vpn2", 0)], self.summary.top_endpoints())
+        # Counters going backwards after a restart don't produce a negative rate
+        self.now = 20.0
+        self.summary.update_stats("vpn1", ServerStats(client_count=1, bytes_in=10, bytes_out=10))
+        self.assertEqual((0, 0), (self.summary.rate_in, self.summary.rate_out))
+        self.assertEqual(3, self.summary.client_count)
+
+    def test_state_counts(self):
+        self.summary.update_state("vpn1", state("CONNECTED"))
+        self.summary.update_state("vpn2", state("CONNECTED"))
+        self.summary.update_state("vpn3", state("RECONNECTING"))
+        self.assertEqual({"CONNECTED": 2, "RECONNECTING": 1}, self.summary.state_counts)
+        self.summary.update_state("vpn3", state("CONNECTED"))
+        self.assertEqual({"CONNECTED": 3}, self.summary.state_counts)
+
+    def test_top_clients(self):
+        self.summary.update_status("vpn1", openvpn_status.parse_status(STATUS))
+        # No rates until a second status arrives
+        self.assertEqual([0, 0], [rate for _, rate in self.summary.top_clients()])
+        self.now = 10.0
+        # alice has transferred the most in total but is now idle, bob is busy
+        busy = STATUS.replace("bob,5.6.7.8:23456,500,100", "bob,5.6.7.8:23456,5500,1100")
+        self.summary.update_status("vpn1", openvpn_status.parse_status(busy))
+        self.assertEqual(
+            [(("vpn1", "5.6.7.8:23456", "bob"), 600), (("vpn1", "1.2.3.4:12345", "alice"), 0)],
+            self.summary.top_clients(),
+        )
+        self.summary.update_status("vpn2", openvpn_status.parse_status(STATUS.replace("bob,5.6.7.8", "carol,9.9.9.9")))
+        self.assertEqual(["bob"], [key[2] for key, _ in self.summary.top_clients(1)])
+        # Clients which have disconnected drop out of the ranking, new clients have no rate until the next status
+        self.now = 20.0
+        later = busy.replace("alice,1.2.3.4:12345,1000,2000", "dave,1.2.3.4:12345,9000,9000")
+        self.summary.update_status("vpn1", openvpn_status.parse_status(later))
+        self.assertEqual(["bob", "dave"], sorted(key[2] for key, _ in self.summary.top_clients() if key[0] == "vpn1"))
+        self.assertEqual(0, sum(rate for _, rate in self.summary.top_clients()))
+        # Counters going backwards after a reconnect don't produce a negative rate
+        self.summary.update_status("vpn1", openvpn_status.parse_status(STATUS), timestamp=30.0)
+        self.assertEqual(0, self.summary.endpoints["vpn1"].client_rates[("vpn1", "5.6.7.8:23456", "bob")])
+
+    def test_errors_and_remove(self):
+        self.summary.update_stats("vpn1", ServerStats(client_count=3, bytes_in=1000, bytes_out=2000))
+        self.summary.update_state("vpn1", state("CONNECTED"))
+        self.summary.update_status("vpn1", openvpn_status.parse_status(STATUS))
+        self.summary.record_error("vpn1", OSError("Connection refused"))
+        self.summary.record_error("vpn1", OSError("Connection refused"))
+        self.assertEqual(1, self.summary.endpoints_down)
+        self.assertEqual("Connection refused", self.summary.endpoints["vpn1"].error)
+        self.summary.update_stats("vpn1", ServerStats(client_count=3, bytes_in=1000, bytes_out=2000))
+        self.assertEqual(0, self.summary.endpoints_down)
+        self.summary.record_error("vpn1", OSError("Connection refused"))
+        self.summary.remove("vpn1")
+        self.summary.remove("vpn1")
+        self.assertEqual(0, self.summary.endpoint_count)
+        self.assertEqual((0, 0, 0), (self.summary.client_count, self.summary.bytes_in, self.summary.endpoints_down))
+        self.assertEqual({}, self.summary.state_counts)
+        self.assertEqual([], self.summary.top_endpoints())
+        self.assertEqual([], self.summary.top_clients())
+
+    def test_on_poll(self):
+        vpn = MagicMock(mgmt_address="localhost:7505")
+        self.summary.on_poll(vpn, ServerStats(client_count=3, bytes_in=1000, bytes_out=2000), None)
+        self.summary.on_poll(vpn, None, OSError("Connection refused"))
+        self.assertEqual(3, self.summary.client_count)
+        self.assertEqual(1, self.summary.endpoints_down)
+        self.assertEqual(["localhost:7505"], list(self.summary.endpoints))
+
+    def test_matches_recalculation(self):
+        rand = random.Random(1)
+        latest = {}
+        for i in range(2000):
+            self.now = float(i)
+            endpoint = f"vpn{rand.randrange(50)}"
+            if rand.random() < 0.05:
+                self.summary.remove(endpoint)
+                latest.pop(endpoint, None)
+                continue
+            stats = ServerStats(rand.randrange(100), rand.randrange(10**9), rand.randrange(10**9))
+            self.summary.update_stats(endpoint, stats)
+            latest[endpoint] = stats
+        self.assertEqual(sum(s.client_count for s in latest.values()), self.summary.client_count)
+        self.assertEqual(sum(s.bytes_in for s in latest.values()), self.summary.bytes_in)
+        self.assertEqual(sum(s.bytes_out for s in latest.values()), self.summary.bytes_out)
+        rates = [e.rate_in + e.rate_out for e in self.summary.endpoints.values()]
+        self.assertAlmostEqual(sum(e.rate_in for e in self.summary.endpoints.values()), self.summary.rate_in, places=3)
+        self.assertEqual(sorted(rates, reverse=True)[:5], [rate for _, rate in self.summary.top_endpoints(5)])
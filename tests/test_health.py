@@ -0,0 +1,92 @@
+import unittest
+
+from openvpn_api.health import EndpointHealth, HealthState
+from openvpn_api.util import errors
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestEndpointHealth(unittest.TestCase):
+    def test_init(self):
+        health = EndpointHealth()
+        self.assertEqual(HealthState.CLOSED, health.state)
+        self.assertTrue(health.allow_request())
+        self.assertEqual(0, health.consecutive_failures)
+        self.assertIsNone(health.retry_at)
+        self.assertEqual("<EndpointHealth state='closed', consecutive_failures=0, total_failures=0>", repr(health))
+
+    def test_opens_after_threshold(self):
+        clock = FakeClock()
+        health = EndpointHealth(failure_threshold=3, backoff=5, clock=clock)
+        health.record_failure(errors.ConnectError("Connection refused"))
+        health.record_failure(errors.ConnectError("Connection refused"))
+        self.assertEqual(HealthState.CLOSED, health.state)
+        health.record_failure(errors.ConnectError("Connection refused"))
+        self.assertEqual(HealthState.OPEN, health.state)
+        self.assertEqual(105, health.retry_at)
+        self.assertEqual("Connection refused", health.last_error)
+        self.assertFalse(health.allow_request())
+        self.assertEqual(1, health.total_rejected)
+        self.assertEqual(1, health.total_opened)
+
+    def test_success_resets(self):
+        health = EndpointHealth(failure_threshold=2)
+        health.record_failure()
+        health.record_success(0.5)
+        health.record_failure()
+        self.assertEqual(HealthState.CLOSED, health.state)
+        self.assertEqual(1, health.consecutive_failures)
+        self.assertEqual(2, health.total_failures)
+        self.assertEqual(0.5, health.latency)
+
+    def test_connect_doesnt_reset(self):
+        health = EndpointHealth(failure_threshold=2)
+        health.record_failure()
+        health.record_connect(0.1)
+        health.record_failure()
+        self.assertEqual(HealthState.OPEN, health.state)
+        self.assertEqual(0.1, health.connect_latency)
+        self.assertIsNone(health.latency)
+
+    def test_half_open(self):
+        clock = FakeClock()
+        health = EndpointHealth(failure_threshold=1, backoff=5, clock=clock)
+        health.record_failure()
+        clock.now += 5
+        self.assertEqual(HealthState.HALF_OPEN, health.state)
+        # Only a single probe allowed at once
+        self.assertTrue(health.allow_request())
+        self.assertFalse(health.allow_request())
+        # Probe which never reports back is replaced after the backoff period
+        clock.now += 5
+        self.assertTrue(health.allow_request())
+        health.record_success()
+        self.assertEqual(HealthState.CLOSED, health.state)
+        self.assertTrue(health.allow_request())
+
+    def test_exponential_backoff(self):
+        clock = FakeClock()
+        health = EndpointHealth(failure_threshold=1, backoff=5, max_backoff=30, clock=clock)
+        for expected in (5, 10, 20, 30, 30):
+            health.record_failure()
+            self.assertEqual(HealthState.OPEN, health.state)
+            self.assertEqual(clock.now + expected, health.retry_at)
+            clock.now = health.retry_at
+            self.assertTrue(health.allow_request())
+        health.record_success()
+        health.record_failure()
+        self.assertEqual(clock.now + 5, health.retry_at)
+
+    def test_reset(self):
+        health = EndpointHealth(failure_threshold=1)
+        health.record_failure()
+        health.reset()
+        self.assertEqual(HealthState.CLOSED, health.state)
+        self.assertEqual(0, health.consecutive_failures)
+        self.assertEqual(1, health.total_failures)
@@ -1,7 +1,7 @@
 import unittest
 from ipaddress import IPv4Address, IPv6Address
 
-from openvpn_api.models import VPNModelBase
+from openvpn_api.models import VPNModelBase, _cached_ip_address
 
 
 class ModelStub(VPNModelBase):
@@ -18,6 +18,15 @@ class TestModelBase(unittest.TestCase):
         self.assertEqual(ModelStub._parse_string(1), "1")
         self.assertEqual(ModelStub._parse_string(False), "False")
 
+    def test_parse_enum_string(self):
+        self.assertIsNone(ModelStub._parse_enum_string(None))
+        self.assertIsNone(ModelStub._parse_enum_string(" "))
+        self.assertEqual("CONNECTED", ModelStub._parse_enum_string(" CONNECTED "))
+        # Equal values parsed from different responses are the same object
+        self.assertIs(
+            ModelStub._parse_enum_string("".join(["CONN", "ECTED"])), ModelStub._parse_enum_string("CONNECTED")
+        )
+
     def test_parse_int(self):
         self.assertIsNone(ModelStub._parse_int(None))
         self.assertEqual(ModelStub._parse_int(0), 0)
@@ -40,6 +49,17 @@ class TestModelBase(unittest.TestCase):
         with self.assertRaises(ValueError):
             ModelStub._parse_ipaddress("asd")
 
+    def test_parse_ipaddress_cached(self):
+        _cached_ip_address.cache_clear()
+        first = ModelStub._parse_ipaddress("10.0.0.1")
+        self.assertIs(first, ModelStub._parse_ipaddress(" 10.0.0.1\n"))
+        info = _cached_ip_address.cache_info()
+        self.assertEqual((1, 1, 1), (info.hits, info.misses, info.currsize))
+        self.assertIsNotNone(info.maxsize)
+        with self.assertRaises(ValueError):
+            ModelStub._parse_ipaddress("asd")
+        self.assertEqual(1, _cached_ip_address.cache_info().currsize)
+
     def test_parse_notification(self):
         self.assertEqual(("BYTECOUNT", "asd"), ModelStub._parse_notification(">BYTECOUNT:asd"))
         self.assertEqual(("CLIENT", "asd:qwe"), ModelStub._parse_notification(">CLIENT:asd:qwe"))
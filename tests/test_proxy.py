@@ -0,0 +1,258 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from openvpn_api.proxy import ManagementProxy
+from openvpn_api.util import errors
+from openvpn_api.vpn import VPN
+
+STATUS = """OpenVPN CLIENT LIST\r
+Updated,Thu Jul 18 20:47:42 2019\r
+Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since\r
+testclient,1.2.3.4:12345,123456789,123456789,Tue Jun 11 21:22:02 2019\r
+ROUTING TABLE\r
+Virtual Address,Common Name,Real Address,Last Ref\r
+10.0.0.2,testclient,1.2.3.4:12345,Wed Jun 12 21:55:04 2019\r
+GLOBAL STATS\r
+Max bcast/mcast queue length,2\r
+END\r
+"""
+
+
+class FakeManagementInterface:
+    """Minimal management interface server which replies to known commands, optionally after a delay."""
+
+    def __init__(self, path, delay=0.0):
+        self.path = path
+        self.delay = delay
+        self.commands = []
+        self.connections = []
+        self.greeting = b">INFO:OpenVPN Management Interface Version 1 -- type 'help' for more info\r\n"
+        self.responses = {
+            "load-stats": "SUCCESS: nclients=1,bytesin=123456789,bytesout=123456789\r\n",
+            "status 1": STATUS,
+            "state on": "SUCCESS: real-time state notification set to ON\r\n",
+        }
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(path)
+        self._sock.listen(5)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            conn.sendall(self.greeting)
+            lines = iter(conn.makefile("rb"))
+            for line in lines:
+                cmd = line.decode().strip()
+                if cmd.startswith("client-auth "):
+                    # Nothing is sent back until the whole block up to END has been received
+                    block = [cmd]
+                    while block[-1] != "END":
+                        block.append(next(lines).decode().strip())
+                    cmd = "\n".join(block)
+                self.commands.append(cmd)
+                if cmd == "quit":
+                    break
+                time.sleep(self.delay)
+                if cmd.startswith("client-auth "):
+                    resp = "SUCCESS: client-auth command succeeded\r\n"
+                else:
+                    resp = self.responses.get(cmd, "ERROR: unknown command, enter 'help' for more options\r\n")
+                conn.sendall(resp if isinstance(resp, bytes) else resp.encode())
+        except (OSError, StopIteration):
+            pass
+        conn.close()
+
+    def push(self, line):
+        for conn in self.connections:
+            conn.sendall(line.encode())
+
+    def close(self):
+        self._sock.close()
+
+
+class TestManagementProxy(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.upstream = FakeManagementInterface(os.path.join(self.tmpdir, "upstream.sock"))
+        self.proxy = ManagementProxy(VPN(unix_socket=self.upstream.path), os.path.join(self.tmpdir, "proxy.sock"))
+        self.proxy.start()
+        self.thread = threading.Thread(target=self.proxy.serve_forever, daemon=True)
+        self.thread.start()
+        # Cleanups run in reverse, so clients created by tests disconnect before the proxy shuts down
+        self.addCleanup(self.stop)
+
+    def stop(self):
+        self.proxy.shutdown()
+        self.thread.join(5)
+        self.upstream.close()
+        shutil.rmtree(self.tmpdir)
+
+    def client(self):
+        vpn = VPN(unix_socket=self.proxy.path)
+        vpn.connect()
+        self.addCleanup(vpn.disconnect)
+        return vpn
+
+    def test_commands(self):
+        a = self.client()
+        b = self.client()
+        self.assertEqual(1, a.get_stats().client_count)
+        self.assertEqual(["1.2.3.4:12345"], list(b.get_status().client_list.keys()))
+        self.assertIn("ERROR: unknown command", a.send_command("asd"))
+        self.assertEqual(["load-stats", "status 1", "asd"], self.upstream.commands)
+        self.assertEqual(1, len(self.upstream.connections))
+        self.assertEqual(2, self.proxy.client_count)
+
+    def test_quit_not_forwarded(self):
+        a = self.client()
+        a.get_stats()
+        a.disconnect()
+        b = self.client()
+        b.get_stats()
+        self.assertEqual(["load-stats", "load-stats"], self.upstream.commands)
+
+    def test_coalesce(self):
+        self.upstream.delay = 0.2
+        results = []
+        clients = [self.client() for _ in range(5)]
+        threads = [threading.Thread(target=lambda c=c: results.append(c.get_stats())) for c in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(5, len(results))
+        self.assertTrue(all(stats.client_count == 1 for stats in results))
+        self.assertLess(self.upstream.commands.count("load-stats"), 5)
+        self.assertEqual(5, self.proxy.upstream_commands + self.proxy.coalesced_commands)
+
+    def test_notifications_broadcast(self):
+        a = self.client()
+        b = self.client()
+        a.send_command("state on")
+        self.upstream.push(">STATE:1560719601,CONNECTED,SUCCESS,10.0.0.1,,,1.2.3.4,1194\r\n")
+        for vpn in (a, b):
+            vpn._socket.settimeout(2)
+            self.assertTrue(vpn._socket_recv().startswith(">STATE:1560719601,CONNECTED"))
+
+    def test_slow_client_dropped(self):
+        self.proxy.max_client_queue = 10
+        self.client()
+        (slow,) = self.proxy._clients
+        fast = self.client()
+        notification = ">LOG:1560719601,," + "x" * 1000 + "\r\n"
+        # Fill the socket buffers of the client which isn't reading, then its queue
+        for _ in range(5000):
+            if not slow.send(notification):
+                break
+        self.assertTrue(slow.overflowed)
+        deadline = time.monotonic() + 5
+        while self.proxy.clients_dropped < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(1, self.proxy.clients_dropped)
+        usage = self.proxy.resource_usage()
+        self.assertEqual(1, usage["clients"])
+        self.assertEqual(0, usage["client_messages_queued"])
+        self.assertEqual(0, usage["notifications_queued"])
+        # Other clients are unaffected
+        self.proxy.broadcast(">LOG:1560719601,,still here\r\n")
+        fast._socket.settimeout(2)
+        self.assertEqual(">LOG:1560719601,,still here\r\n", fast._socket_recv())
+
+    def test_multiline_command(self):
+        a = self.client()
+        block = 'client-auth 1 2\npush "route 10.0.0.0 255.0.0.0"\npush "dhcp-option DNS 10.0.0.1"\nEND'
+        self.assertEqual("SUCCESS: client-auth command succeeded\r\n", a.send_command(block))
+        self.assertEqual(1, a.get_stats().client_count)
+        self.assertEqual([block, "load-stats"], self.upstream.commands)
+        self.assertEqual(1, len(self.upstream.connections))
+        # client-auth-nt takes no input block
+        self.assertIn("ERROR: unknown command", a.send_command("client-auth-nt 1 2"))
+
+    def test_coalesced_timeout_leaves_upstream(self):
+        self.proxy.execute("load-stats")
+        self.proxy.timeout = 0.2
+        results = {}
+
+        def run(name):
+            try:
+                results[name] = self.proxy.execute("load-stats")
+            except errors.CommandTimeoutError as e:
+                results[name] = e
+
+        # Another client's command holds the upstream connection for longer than the timeout
+        with self.proxy._command_lock:
+            leader = threading.Thread(target=run, args=("leader",))
+            leader.start()
+            time.sleep(0.05)
+            follower = threading.Thread(target=run, args=("follower",))
+            follower.start()
+            follower.join(5)
+            self.assertIsInstance(results["follower"], errors.CommandTimeoutError)
+            self.assertTrue(self.proxy.vpn.is_connected)
+        leader.join(5)
+        self.assertTrue(results["leader"].startswith("SUCCESS: nclients=1"))
+        self.assertEqual(1, len(self.upstream.connections))
+
+    def test_upstream_split_character(self):
+        # Two byte character split across the first 4096 byte read
+        resp = "SUCCESS: " + "a" * (4095 - len("SUCCESS: ")) + "\u00e9\r\n"
+        self.upstream.responses["pid"] = resp
+        self.assertEqual(resp, self.proxy.execute("pid"))
+
+    def test_upstream_bad_data(self):
+        self.proxy.timeout = 5
+        self.proxy.vpn._lines.max_length = 100
+        for resp, error in ((b"\xff\xfe\r\n", errors.ConnectError), ("x" * 200, errors.BufferOverflowError)):
+            with self.subTest(error=error):
+                self.upstream.responses["pid"] = resp
+                started = time.monotonic()
+                with self.assertRaises(error):
+                    self.proxy.execute("pid")
+                # Fails as soon as the bad data arrives rather than waiting for the timeout
+                self.assertLess(time.monotonic() - started, 1)
+                self.assertFalse(self.proxy.vpn.is_connected)
+        self.assertTrue(self.proxy.execute("load-stats").startswith("SUCCESS: nclients=1"))
+
+    def test_upstream_bad_greeting(self):
+        self.upstream.greeting = b"asd\r\n"
+        a = self.client()
+        self.assertTrue(a.send_command("load-stats").startswith("ERROR: Did not get expected response"))
+        self.assertFalse(self.proxy.vpn.is_connected)
+        # Downstream client stays connected and the next command connects afresh
+        self.upstream.greeting = b">INFO:OpenVPN Management Interface Version 1\r\n"
+        self.assertEqual(1, a.get_stats().client_count)
+
+    def test_upstream_send_failure(self):
+        a = self.client()
+        a.get_stats()
+        with patch.object(self.proxy.vpn, "_socket_send", side_effect=BrokenPipeError(32, "Broken pipe")):
+            self.assertEqual("ERROR: [Errno 32] Broken pipe\r\n", a.send_command("load-stats"))
+        self.assertFalse(self.proxy.vpn.is_connected)
+        self.assertEqual(1, a.get_stats().client_count)
+        self.assertEqual(2, len(self.upstream.connections))
+
+    def test_upstream_timeout(self):
+        self.proxy.timeout = 0.1
+        self.upstream.delay = 0.5
+        with self.assertRaises(errors.CommandTimeoutError):
+            self.proxy.execute("load-stats")
+        self.assertFalse(self.proxy.vpn.is_connected)
+        # Reconnects on next command
+        self.upstream.delay = 0
+        self.assertTrue(self.proxy.execute("load-stats").startswith("SUCCESS: nclients=1"))
+        self.assertEqual(2, len(self.upstream.connections))
@@ -0,0 +1,308 @@
+import gc
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+import openvpn_status
+
+from openvpn_api.models.state import State
+from openvpn_api.replay import (
+    CONNECT,
+    RECV,
+    SEND,
+    RecordingVPN,
+    ReplayServer,
+    SessionRecorder,
+    load_session,
+    save_session,
+    split_connections,
+)
+
+logger = logging.getLogger(__name__)
+
+# Set to run benchmarks at a size which gives meaningful timings, they run at a token size otherwise
+BENCHMARK = bool(os.environ.get("OPENVPN_API_BENCHMARK"))
+
+GREETING = ">INFO:OpenVPN Management Interface Version 1 -- type 'help' for more info\r\n"
+
+
+def chunked(data, size=4096):
+    """Split data into chunks as it would be received from a socket."""
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def status_response(clients):
+    lines = [
+        "OpenVPN CLIENT LIST",
+        "Updated,Thu Jul 18 20:47:42 2019",
+        "Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since",
+    ]
+    for i in range(clients):
+        lines.append(
+            f"client{i},10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}:{1024 + i % 60000},"
+            f"{i * 1000},{i * 2000},Tue Jun 11 21:22:02 2019"
+        )
+    lines += ["ROUTING TABLE", "Virtual Address,Common Name,Real Address,Last Ref"]
+    for i in range(clients):
+        lines.append(
+            f"172.16.{i // 256 % 256}.{i % 256},client{i},10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}:"
+            f"{1024 + i % 60000},Wed Jun 12 21:55:04 2019"
+        )
+    lines += ["GLOBAL STATS", "Max bcast/mcast queue length,2", "END"]
+    return "".join(line + "\r\n" for line in lines)
+
+
+def synthesise_session(clients=100, polls=5, interval=0.0):
+    """Build a realistic session of repeated load-stats, status and state polls of a busy server.
+
+    Byte count and client notifications are interleaved where the management interface would send them between
+    responses and, for status and state, part way through the response.
+    """
+    events = [(0.0, CONNECT, ""), (0.001, RECV, GREETING)]
+    t = 0.001
+    for poll in range(polls):
+        notifications = "".join(f">BYTECOUNT_CLI:{cid},{poll * 1000 + cid},{poll * 2000 + cid}\r\n" for cid in range(5))
+        t += interval
+        events.append((t, SEND, "load-stats\n"))
+        t += 0.001
+        events.append((t, RECV, notifications + f"SUCCESS: nclients={clients},bytesin={poll},bytesout={poll}\r\n"))
+        t += 0.001
+        events.append((t, SEND, "status 1\n"))
+        status = status_response(clients)
+        middle = status.index("\n", len(status) // 2) + 1
+        status = status[:middle] + f">BYTECOUNT_CLI:0,{poll},{poll}\r\n" + status[middle:]
+        for chunk in chunked(status):
+            t += 0.0001
+            events.append((t, RECV, chunk))
+        t += 0.001
+        events.append((t, SEND, "state\n"))
+        t += 0.001
+        events.append(
+            (
+                t,
+                RECV,
+                f">CLIENT:ESTABLISHED,{poll}\r\n1560719601,CONNECTED,SUCCESS,10.0.0.1,,,1.2.3.4,1194\r\n"
+                ">BYTECOUNT_CLI:1,1,1\r\nEND\r\n",
+            )
+        )
+    events.append((t + 0.001, SEND, "quit\n"))
+    return events
+
+
+class TestSessionFiles(unittest.TestCase):
+    def test_save_load(self):
+        events = synthesise_session(clients=10, polls=2)
+        f = io.StringIO()
+        save_session(events, f)
+        f.seek(0)
+        self.assertEqual(events, load_session(f))
+
+    def test_recorder(self):
+        f = io.StringIO()
+        with SessionRecorder(f) as recorder:
+            recorder.record(CONNECT, "")
+            recorder.record(SEND, "status\n")
+        self.assertEqual(2, recorder.events)
+        f.seek(0)
+        events = load_session(f)
+        self.assertEqual([CONNECT, SEND], [event[1] for event in events])
+        self.assertEqual(0, events[0][0])
+
+    def test_split_connections(self):
+        events = [(0, CONNECT, ""), (1, RECV, "a"), (2, CONNECT, ""), (3, RECV, "b"), (4, CONNECT, "")]
+        self.assertEqual([[(1, RECV, "a")], [(3, RECV, "b")]], split_connections(events))
+        self.assertEqual([[(1, RECV, "a")]], split_connections([(1, RECV, "a")]))
+        with self.assertRaises(ValueError):
+            ReplayServer([])
+
+
+class TestReplayServer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def check_session(self, vpn, clients=100, polls=5):
+        with vpn.connection():
+            for _ in range(polls):
+                self.assertEqual(clients, vpn.get_stats().client_count)
+                status = vpn.get_status()
+                self.assertEqual(clients, len(status.client_list))
+                self.assertEqual(clients, len(status.routing_table))
+                self.assertEqual("CONNECTED", vpn.get_state().state_name)
+        # 5 byte counts before load-stats, 1 during status and a client event and byte count during state
+        self.assertEqual(8 * polls, len(vpn.read_notifications()))
+
+    def test_replay_tcp(self):
+        with ReplayServer(synthesise_session(), speed=0) as server:
+            self.check_session(server.vpn())
+
+    def test_replay_unix_socket(self):
+        path = os.path.join(self.tmpdir, "replay.sock")
+        with ReplayServer(synthesise_session(), unix_socket=path, speed=0) as server:
+            self.check_session(server.vpn())
+            # Each connection is served the session afresh
+            self.check_session(server.vpn())
+            self.assertEqual(2, server.served)
+        self.assertFalse(os.path.exists(path))
+
+    def test_replay_notification_callback(self):
+        notifications = []
+        with ReplayServer(synthesise_session(clients=10, polls=1), speed=0) as server:
+            vpn = server.vpn(on_notification=notifications.append)
+            with vpn.connection():
+                vpn.get_stats()
+                status = vpn.get_status()
+                vpn.get_state()
+        self.assertEqual(10, len(status.client_list))
+        self.assertEqual(">BYTECOUNT_CLI:0,0,0", notifications[5])
+        self.assertEqual(">CLIENT:ESTABLISHED,0", notifications[6])
+        self.assertEqual(8, len(notifications))
+        self.assertFalse(vpn.notifications)
+
+    def test_replay_speed(self):
+        events = [
+            (0.0, RECV, GREETING),
+            (1.0, SEND, "load-stats\n"),
+            (1.2, RECV, "SUCCESS: nclients=1,bytesin=1,bytesout=1\r\n"),
+        ]
+        for speed, minimum, maximum in ((1, 0.2, 1), (2, 0.1, 0.2), (0, 0, 0.1)):
+            with ReplayServer(events, speed=speed) as server:
+                vpn = server.vpn()
+                vpn.connect()
+                started = time.monotonic()
+                vpn.get_stats()
+                elapsed = time.monotonic() - started
+                vpn.disconnect()
+            self.assertGreaterEqual(elapsed, minimum)
+            # Upper bounds are only checked when benchmarking, as loaded machines can be arbitrarily slow
+            if BENCHMARK:
+                self.assertLess(elapsed, maximum)
+
+    def test_record_replay(self):
+        """Record a session from a replay server and check it replays the same."""
+        original = synthesise_session(clients=20, polls=2)
+        path = os.path.join(self.tmpdir, "session.ndjson")
+        with ReplayServer(original, speed=0) as server:
+            with SessionRecorder(path) as recorder:
+                vpn = RecordingVPN(host=server.host, port=server.port, recorder=recorder)
+                self.check_session(vpn, clients=20, polls=2)
+        recorded = load_session(path)
+        self.assertEqual(CONNECT, recorded[0][1])
+        self.assertEqual(
+            [data for _, direction, data in original if direction == SEND],
+            [data for _, direction, data in recorded if direction == SEND],
+        )
+        self.assertEqual(
+            "".join(data for _, direction, data in original if direction == RECV),
+            "".join(data for _, direction, data in recorded if direction == RECV),
+        )
+        with ReplayServer(recorded, speed=0) as server:
+            self.check_session(server.vpn(), clients=20, polls=2)
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Parser and transport benchmarks against large sessions, timings are logged at info level.
+
+    With OPENVPN_API_BENCHMARK set each benchmark fails if throughput drops below a floor set well under what a typical
+    machine manages, so only serious regressions fail. Otherwise they only run at a token size to check they work, as
+    timings on a loaded machine are meaningless.
+    """
+
+    clients = 5000 if BENCHMARK else 200
+    polls = 50 if BENCHMARK else 3
+
+    def assertRate(self, count, elapsed, minimum):
+        """Assert at least `minimum` operations per second were achieved, when benchmarking."""
+        if BENCHMARK:
+            self.assertGreater(count / max(elapsed, 1e-9), minimum)
+
+    def test_parse_status(self):
+        raw = status_response(self.clients)
+        started = time.perf_counter()
+        for _ in range(self.polls):
+            openvpn_status.parse_status(raw)
+        elapsed = time.perf_counter() - started
+        logger.info("Parsed %d status responses of %d clients in %.3fs", self.polls, self.clients, elapsed)
+        # Client rows per second, around 15,000 is typical
+        self.assertRate(self.polls * self.clients, elapsed, 2000)
+
+    def test_parse_state(self):
+        raw = ">CLIENT:ESTABLISHED,1\r\n1560719601,CONNECTED,SUCCESS,10.0.0.1,,,1.2.3.4,1194\r\nEND\r\n"
+        iterations = self.polls * 1000
+        started = time.perf_counter()
+        for _ in range(iterations):
+            State.parse_raw(raw)
+        elapsed = time.perf_counter() - started
+        logger.info("Parsed %d state responses in %.3fs", iterations, elapsed)
+        # Responses per second, around 100,000 is typical
+        self.assertRate(iterations, elapsed, 10000)
+
+    def test_transport(self):
+        with ReplayServer(synthesise_session(self.clients, self.polls), speed=0) as server:
+            vpn = server.vpn()
+            started = time.perf_counter()
+            with vpn.connection():
+                for _ in range(self.polls):
+                    vpn.get_stats()
+                    vpn.get_status()
+                    vpn.get_state()
+            elapsed = time.perf_counter() - started
+        logger.info("Replayed %d polls of %d clients in %.3fs", self.polls, self.clients, elapsed)
+        # Client rows received and parsed per second, around 13,000 is typical
+        self.assertRate(self.polls * self.clients, elapsed, 2000)
+
+
+class TestSoak(unittest.TestCase):
+    """Run many commands over many reconnects, checking memory use doesn't grow.
+
+    With OPENVPN_API_BENCHMARK set this runs a million commands, which takes a while.
+    """
+
+    connections = 1000 if BENCHMARK else 20
+    commands = 1000 if BENCHMARK else 50
+
+    def test_memory_flat(self):
+        events = [(0.0, RECV, GREETING)]
+        for _ in range(self.commands):
+            events.append((0.0, SEND, "load-stats\n"))
+            events.append((0.0, RECV, ">BYTECOUNT:1,2\r\nSUCCESS: nclients=1,bytesin=1,bytesout=1\r\n"))
+        with ReplayServer(events, speed=0) as server:
+            vpn = server.vpn(max_notifications=self.commands)
+
+            def run(connections):
+                for _ in range(connections):
+                    vpn.reconnect()
+                    for _ in range(self.commands):
+                        vpn.get_stats()
+
+            tracemalloc.start()
+            try:
+                # Warm up until the notification queue is full and everything cached has been allocated
+                run(2)
+                gc.collect()
+                baseline = tracemalloc.get_traced_memory()[0]
+                started = time.perf_counter()
+                run(self.connections)
+                elapsed = time.perf_counter() - started
+                gc.collect()
+                growth = tracemalloc.get_traced_memory()[0] - baseline
+            finally:
+                tracemalloc.stop()
+                vpn.disconnect()
+        logger.info(
+            "Ran %d commands over %d connections in %.3fs, memory grew %d bytes",
+            self.connections * self.commands,
+            self.connections,
+            elapsed,
+            growth,
+        )
+        self.assertLess(growth, 64 * 1024)
+        usage = vpn.resource_usage()
+        self.assertEqual(self.connections + 1, usage["reconnects"])
+        self.assertEqual(self.commands, usage["notifications_queued"])
+        self.assertEqual((self.connections + 1) * self.commands, usage["notifications_dropped"])
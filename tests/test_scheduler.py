@@ -0,0 +1,194 @@
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from openvpn_api.models.stats import ServerStats
+from openvpn_api.scheduler import AdaptivePoller
+from openvpn_api.util import errors
+from openvpn_api.vpn import VPN
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_poller(**kwargs):
+    clock = FakeClock()
+    kwargs.setdefault("min_interval", 5)
+    kwargs.setdefault("max_interval", 300)
+    kwargs.setdefault("jitter", 0)
+    poller = AdaptivePoller(clock=clock, **kwargs)
+    return poller, clock
+
+
+class TestAdaptivePoller(unittest.TestCase):
+    def test_invalid_intervals(self):
+        with self.assertRaises(ValueError):
+            AdaptivePoller(min_interval=10, max_interval=5)
+
+    def test_busy_speeds_up_idle_backs_off(self):
+        poller, clock = make_poller(initial_interval=40)
+        target = poller.add(VPN(host="localhost", port=1234))
+        # First poll is always treated as busy
+        poller._reschedule(target, ServerStats(1, 0, 0), None, 0.01, clock.now)
+        self.assertEqual(20, target.interval)
+        # Client count changed
+        clock.now += 20
+        poller._reschedule(target, ServerStats(2, 0, 0), None, 0.01, clock.now)
+        self.assertEqual(10, target.interval)
+        # Traffic above idle rate
+        clock.now += 10
+        poller._reschedule(target, ServerStats(2, 1000000, 0), None, 0.01, clock.now)
+        self.assertEqual(5, target.interval)
+        # Never below min_interval
+        clock.now += 5
+        poller._reschedule(target, ServerStats(3, 1000000, 0), None, 0.01, clock.now)
+        self.assertEqual(5, target.interval)
+        self.assertEqual(clock.now + 5, target.next_poll)
+        # Idle backs off to max_interval and no further
+        for _ in range(20):
+            clock.now += target.interval
+            poller._reschedule(target, ServerStats(3, 1000000, 0), None, 0.01, clock.now)
+        self.assertEqual(300, target.interval)
+
+    def test_counter_reset_is_busy(self):
+        poller, clock = make_poller(initial_interval=100)
+        target = poller.add(VPN(host="localhost", port=1234))
+        poller._reschedule(target, ServerStats(1, 5000, 5000), None, 0.01, clock.now)
+        clock.now += 50
+        poller._reschedule(target, ServerStats(1, 10, 10), None, 0.01, clock.now)
+        self.assertEqual(25, target.interval)
+
+    def test_errors_back_off(self):
+        poller, clock = make_poller()
+        target = poller.add(VPN(host="localhost", port=1234))
+        for expected in (10, 20, 40, 80, 160, 300, 300):
+            poller._reschedule(target, None, errors.ConnectError(), 3, clock.now)
+            self.assertEqual(expected, target.interval)
+        self.assertEqual(7, target.consecutive_errors)
+        self.assertGreater(target.error_rate, 0.9)
+        poller._reschedule(target, ServerStats(1, 0, 0), None, 0.01, clock.now)
+        self.assertEqual(0, target.consecutive_errors)
+
+    def test_slow_server_floor(self):
+        poller, clock = make_poller(latency_factor=10)
+        target = poller.add(VPN(host="localhost", port=1234))
+        poller._reschedule(target, ServerStats(1, 0, 0), None, 2.0, clock.now)
+        self.assertEqual(20, target.interval)
+
+    def test_jitter(self):
+        poller, clock = make_poller(initial_interval=100, jitter=0.1, rand=lambda a, b: b)
+        target = poller.add(VPN(host="localhost", port=1234))
+        poller._reschedule(target, ServerStats(1, 0, 0), None, 0.01, clock.now)
+        self.assertEqual(50, target.interval)
+        self.assertAlmostEqual(clock.now + 55, target.next_poll)
+
+    def test_priority_and_budget(self):
+        poller, clock = make_poller(max_concurrency=2)
+        vpns = [VPN(host="localhost", port=i) for i in range(1, 5)]
+        targets = [poller.add(vpn) for vpn in vpns]
+        poller.remove(vpns[0])
+        # Rescheduled into the future so should come out last
+        poller._queue.clear()
+        for target, due in zip(targets[1:], (clock.now + 1, clock.now - 2, clock.now - 1)):
+            target.next_poll = due
+            poller._push(target)
+        self.assertIs(targets[2], poller._pop_due(clock.now))
+        self.assertIs(targets[3], poller._pop_due(clock.now))
+        # Budget exhausted
+        self.assertIsNone(poller._pop_due(clock.now + 10))
+        poller._in_flight = 0
+        self.assertIsNone(poller._pop_due(clock.now))
+        self.assertEqual(clock.now + 1, poller.next_due())
+        self.assertIs(targets[1], poller._pop_due(clock.now + 1))
+
+    @patch("openvpn_api.vpn.VPN.get_stats")
+    @patch("openvpn_api.vpn.VPN.connect")
+    def test_poll(self, mock_connect, mock_get_stats):
+        callback = MagicMock()
+        poller, clock = make_poller(callback=callback)
+        vpn = VPN(host="localhost", port=1234)
+        mock_connect.side_effect = lambda: setattr(vpn, "_socket", MagicMock())
+        stats = ServerStats(1, 2, 3)
+        mock_get_stats.return_value = stats
+        target = poller.add(vpn)
+        poller._in_flight = 1
+        poller.poll(target)
+        mock_connect.assert_called_once()
+        callback.assert_called_once_with(vpn, stats, None)
+        self.assertEqual(0, poller._in_flight)
+        self.assertIs(stats, target.last_stats)
+        # Connection kept open between polls
+        poller.poll(target)
+        mock_connect.assert_called_once()
+        # Failure drops connection and reports error
+        error = errors.ParseError("asd")
+        mock_get_stats.side_effect = error
+        callback.reset_mock()
+        poller.poll(target)
+        callback.assert_called_once_with(vpn, None, error)
+        self.assertFalse(vpn.is_connected)
+
+    @patch("openvpn_api.vpn.VPN.get_stats")
+    @patch("openvpn_api.vpn.VPN.connect")
+    def test_poll_unexpected_error(self, mock_connect, mock_get_stats):
+        callback = MagicMock()
+        poller, clock = make_poller(callback=callback)
+        vpn = VPN(host="localhost", port=1234)
+        mock_connect.side_effect = lambda: setattr(vpn, "_socket", MagicMock())
+        error = KeyError("asd")
+        mock_get_stats.side_effect = error
+        target = poller.add(vpn)
+        self.assertIs(target, poller._pop_due(clock.now))
+        with self.assertLogs("openvpn_api.scheduler", "ERROR"):
+            poller.poll(target)
+        # Budget released and server still scheduled
+        self.assertEqual(0, poller._in_flight)
+        self.assertFalse(target.in_flight)
+        self.assertEqual(1, target.consecutive_errors)
+        self.assertEqual(target.next_poll, poller.next_due())
+        callback.assert_called_once_with(vpn, None, error)
+        self.assertFalse(vpn.is_connected)
+
+    @patch("openvpn_api.vpn.VPN.disconnect")
+    def test_remove_disconnects(self, mock_disconnect):
+        poller, clock = make_poller()
+        idle = VPN(host="localhost", port=1234)
+        busy = VPN(host="localhost", port=1235)
+        poller.add(idle)
+        target = poller.add(busy)
+        poller.remove(idle)
+        mock_disconnect.assert_called_once_with(_quit=True)
+        # Connection of a server being polled is closed once the poll finishes
+        mock_disconnect.reset_mock()
+        self.assertIs(target, poller._pop_due(clock.now))
+
+        def get_stats():
+            poller.remove(busy)
+            mock_disconnect.assert_not_called()
+            return ServerStats(1, 2, 3)
+
+        busy._socket = MagicMock()
+        with patch("openvpn_api.vpn.VPN.get_stats", side_effect=get_stats):
+            poller.poll(target)
+        mock_disconnect.assert_called_once_with(_quit=True)
+        self.assertIsNone(poller.next_due())
+
+    @patch("openvpn_api.vpn.VPN.disconnect")
+    @patch("openvpn_api.vpn.VPN.get_stats")
+    @patch("openvpn_api.vpn.VPN.connect")
+    def test_run(self, mock_connect, mock_get_stats, mock_disconnect):
+        polled = threading.Event()
+        poller = AdaptivePoller([VPN(host="localhost", port=1234)], callback=lambda *args: polled.set())
+        mock_get_stats.return_value = ServerStats(1, 2, 3)
+        thread = threading.Thread(target=poller.run)
+        thread.start()
+        self.assertTrue(polled.wait(5))
+        poller.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        mock_disconnect.assert_called()
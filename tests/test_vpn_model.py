@@ -1,9 +1,13 @@
 import unittest
 import socket
+import threading
 from unittest.mock import patch, PropertyMock, ANY, MagicMock
 import openvpn_status
+from openvpn_api.health import EndpointHealth, HealthState
 from openvpn_api.util import errors
-from openvpn_api.vpn import VPN, VPNType
+from openvpn_api.vpn import VPN, OverflowPolicy, VPNType
+
+GREETING = ">INFO:OpenVPN Management Interface Version 1 -- type 'help' for more info\r\n"
 
 
 def gen_mock_values(values):
@@ -78,6 +82,7 @@ class TestVPNModel(unittest.TestCase):
     @patch("openvpn_api.vpn.socket.create_connection")
     def test_send_command(self, mock_create_connection, mock_socket_send, mock_socket_recv):
         vpn = VPN(host="localhost", port=1234)
+        mock_socket_recv.return_value = GREETING
         vpn.connect()
         mock_create_connection.assert_called_once_with(("localhost", 1234), timeout=ANY)
         mock_socket_recv.assert_called_once()
@@ -101,17 +106,18 @@ class TestVPNModel(unittest.TestCase):
         #   kill 1.2.3.4:12345
         #   SUCCESS: 1 client(s) at address 1.2.3.4:12345 killed
         vpn = VPN(host="localhost", port=1234)
+        mock_socket_recv.return_value = GREETING
         vpn.connect()
         mock_create_connection.assert_called_once_with(("localhost", 1234), timeout=ANY)
         mock_socket_recv.assert_called_once()
         mock_socket_recv.reset_mock()
-        mock_socket_recv.return_value = "SUCCESS: 1 client(s) at address 1.2.3.4:12345 killed"
+        mock_socket_recv.return_value = "SUCCESS: 1 client(s) at address 1.2.3.4:12345 killed\r\n"
         vpn.send_command("kill 1.2.3.4:12345")
         mock_socket_send.assert_called_once_with("kill 1.2.3.4:12345\n")
         mock_socket_recv.assert_called_once()
         mock_socket_send.reset_mock()
         mock_socket_recv.reset_mock()
-        mock_socket_recv.return_value = "SUCCESS: client-kill command succeeded"
+        mock_socket_recv.return_value = "SUCCESS: client-kill command succeeded\r\n"
         vpn.send_command("client-kill 1")
         mock_socket_send.assert_called_once_with("client-kill 1\n")
         mock_socket_recv.assert_called_once()
@@ -121,11 +127,12 @@ class TestVPNModel(unittest.TestCase):
     @patch("openvpn_api.vpn.socket.create_connection")
     def test_send_sigterm(self, mock_create_connection, mock_socket_send, mock_socket_recv):
         vpn = VPN(host="localhost", port=1234)
+        mock_socket_recv.return_value = GREETING
         vpn.connect()
         mock_create_connection.assert_called_once_with(("localhost", 1234), timeout=ANY)
         mock_socket_recv.assert_called_once()
         mock_socket_recv.reset_mock()
-        mock_socket_recv.return_value = "SUCCESS: signal SIGTERM thrown"
+        mock_socket_recv.return_value = "SUCCESS: signal SIGTERM thrown\r\n"
         vpn.send_sigterm()
         mock_socket_send.assert_called_once_with("signal SIGTERM\n")
         mock_socket_recv.assert_called_once()
@@ -243,3 +250,374 @@ END
         self.assertIsInstance(status, openvpn_status.models.Status)
         self.assertEqual(len(status.client_list), 1)
         self.assertEqual(list(status.client_list.keys()), ["1.2.3.4:12345"])
+
+    def test_timeouts(self):
+        vpn = VPN(host="localhost", port=1234)
+        self.assertEqual(3, vpn.connect_timeout)
+        self.assertEqual(3, vpn.read_timeout)
+        self.assertIsNone(vpn.timeout)
+        vpn = VPN(unix_socket="file.sock", connect_timeout=1, read_timeout=None, timeout=10)
+        self.assertEqual(1, vpn.connect_timeout)
+        self.assertIsNone(vpn.read_timeout)
+        self.assertEqual(10, vpn.timeout)
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_connect_timeout(self, mock_create_connection, mock_socket_recv):
+        vpn = VPN(host="localhost", port=1234, connect_timeout=5)
+        mock_socket_recv.return_value = GREETING
+        vpn.connect()
+        mock_create_connection.assert_called_once_with(("localhost", 1234), timeout=5)
+        mock_create_connection.reset_mock()
+        vpn.connect(timeout=1)
+        mock_create_connection.assert_called_once_with(("localhost", 1234), timeout=1)
+        mock_create_connection.reset_mock()
+        with vpn.deadline(0.5):
+            vpn.connect()
+        self.assertLessEqual(mock_create_connection.call_args[1]["timeout"], 0.5)
+        mock_socket_recv.side_effect = socket.timeout()
+        with self.assertRaises(errors.ConnectError):
+            vpn.connect()
+        self.assertFalse(vpn.is_connected)
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.VPN._socket_send")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_send_command_read_timeout(self, mock_create_connection, mock_socket_send, mock_socket_recv):
+        vpn = VPN(host="localhost", port=1234, read_timeout=2)
+        mock_socket_recv.return_value = GREETING
+        vpn.connect()
+        vals = gen_mock_values(["asd\n"])
+
+        def recv():
+            for val in vals:
+                return val
+            raise socket.timeout()
+
+        mock_socket_recv.side_effect = recv
+        with self.assertRaises(errors.CommandTimeoutError):
+            vpn.send_command("status")
+        mock_create_connection.return_value.settimeout.assert_called_with(2)
+        self.assertFalse(vpn.is_connected)
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.VPN._socket_send")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_send_command_deadline(self, mock_create_connection, mock_socket_send, mock_socket_recv):
+        vpn = VPN(host="localhost", port=1234)
+        mock_socket_recv.return_value = GREETING
+        vpn.connect()
+        mock_socket_recv.return_value = "asd\n"
+        with self.assertRaises(errors.CommandTimeoutError):
+            vpn.send_command("status", timeout=0)
+        self.assertFalse(vpn.is_connected)
+        mock_socket_recv.return_value = ">INFO:OpenVPN Management Interface Version 1\n"
+        vpn.connect()
+        with vpn.deadline(60):
+            with vpn.deadline(0):
+                with self.assertRaises(errors.CommandTimeoutError):
+                    vpn.send_command("status")
+            self.assertIsNotNone(vpn._deadline)
+        self.assertIsNone(vpn._deadline)
+
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_connect_deadline_passed(self, mock_create_connection):
+        vpn = VPN(host="localhost", port=1234, health=EndpointHealth(failure_threshold=1))
+        with vpn.deadline(0):
+            with self.assertRaises(errors.CommandTimeoutError):
+                vpn.connect()
+        mock_create_connection.assert_not_called()
+        # Running out of time isn't the endpoint's fault
+        self.assertEqual(0, vpn.health.total_failures)
+        self.assertFalse(vpn.is_connected)
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.VPN._socket_send")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_send_command_closed(self, mock_create_connection, mock_socket_send, mock_socket_recv):
+        vpn = VPN(host="localhost", port=1234)
+        mock_socket_recv.return_value = GREETING
+        vpn.connect()
+        vals = gen_mock_values(["asd\n", ""])
+        mock_socket_recv.side_effect = lambda: next(vals)
+        with self.assertRaises(errors.ConnectError) as ctx:
+            vpn.send_command("status")
+        self.assertEqual("Connection closed by management interface.", str(ctx.exception))
+        self.assertFalse(vpn.is_connected)
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.VPN._socket_send")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_send_command_error(self, mock_create_connection, mock_socket_send, mock_socket_recv):
+        vpn = VPN(host="localhost", port=1234)
+        mock_socket_recv.return_value = GREETING
+        vpn.connect()
+        mock_socket_recv.reset_mock()
+        mock_socket_recv.return_value = "ERROR: unknown command, enter 'help' for more options\r\n"
+        self.assertEqual(mock_socket_recv.return_value, vpn.send_command("asd"))
+        mock_socket_recv.assert_called_once()
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.VPN._socket_send")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_send_command_send_failure(self, mock_create_connection, mock_socket_send, mock_socket_recv):
+        health = EndpointHealth()
+        vpn = VPN(host="localhost", port=1234, health=health)
+        mock_socket_recv.return_value = GREETING
+        vpn.connect()
+        for error, expected in (
+            (BrokenPipeError(), errors.ConnectError),
+            (socket.timeout(), errors.CommandTimeoutError),
+        ):
+            with self.subTest(error=error):
+                vpn.connect()
+                mock_socket_send.side_effect = error
+                with self.assertRaises(expected):
+                    vpn.send_command("status")
+                self.assertFalse(vpn.is_connected)
+                mock_create_connection.return_value.close.assert_called()
+        self.assertEqual(2, health.total_failures)
+
+    def test_cancel(self):
+        vpn = VPN(unix_socket="file.sock", read_timeout=None)
+        vpn._socket, server = socket.socketpair()
+        try:
+            threading.Timer(0.1, vpn.cancel).start()
+            with self.assertRaises(errors.CommandCancelledError):
+                vpn.send_command("status")
+            self.assertFalse(vpn.is_connected)
+        finally:
+            server.close()
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_connect_health(self, mock_create_connection, mock_socket_recv):
+        health = EndpointHealth(failure_threshold=2)
+        vpn = VPN(host="localhost", port=1234, health=health)
+        mock_socket_recv.return_value = ">INFO:OpenVPN Management Interface Version 1\n"
+        vpn.connect()
+        # Connecting alone doesn't count as a success, only a command being answered does
+        self.assertEqual(0, health.total_successes)
+        self.assertIsNotNone(health.connect_latency)
+        vpn._socket = None
+        mock_create_connection.side_effect = socket.error()
+        for _ in range(2):
+            with self.assertRaises(errors.ConnectError):
+                vpn.connect()
+        self.assertEqual(HealthState.OPEN, health.state)
+        mock_create_connection.reset_mock()
+        with self.assertRaises(errors.CircuitOpenError):
+            vpn.connect()
+        mock_create_connection.assert_not_called()
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.VPN._socket_send")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_send_command_health(self, mock_create_connection, mock_socket_send, mock_socket_recv):
+        health = EndpointHealth()
+        vpn = VPN(host="localhost", port=1234, health=health)
+        mock_socket_recv.return_value = GREETING
+        vpn.connect()
+        mock_socket_recv.return_value = "SUCCESS: nclients=3,bytesin=129822996,bytesout=126946564\n"
+        vpn.send_command("load-stats")
+        self.assertEqual(1, health.total_successes)
+        self.assertIsNotNone(health.latency)
+        mock_socket_recv.side_effect = socket.timeout()
+        with self.assertRaises(errors.CommandTimeoutError):
+            vpn.send_command("load-stats")
+        self.assertEqual(1, health.consecutive_failures)
+
+    def test_health_silent_server(self):
+        """A server which accepts connections and greets but never answers commands trips the circuit."""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        server.listen(5)
+        self.addCleanup(server.close)
+        connections = []
+
+        def accept():
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    return
+                connections.append(conn)
+                conn.sendall(b">INFO:OpenVPN Management Interface Version 1\r\n")
+
+        threading.Thread(target=accept, daemon=True).start()
+        health = EndpointHealth(failure_threshold=2)
+        vpn = VPN(host="127.0.0.1", port=server.getsockname()[1], read_timeout=0.05, health=health)
+        for _ in range(2):
+            vpn.connect()
+            with self.assertRaises(errors.CommandTimeoutError):
+                vpn.get_stats()
+        self.assertEqual(HealthState.OPEN, health.state)
+        self.assertEqual(2, health.consecutive_failures)
+        with self.assertRaises(errors.CircuitOpenError):
+            vpn.connect()
+        self.assertEqual(2, len(connections))
+        for conn in connections:
+            conn.close()
+
+    @patch("openvpn_api.vpn.VPN.send_command")
+    def test_set_bytecount(self, mock_send_command):
+        vpn = VPN(host="localhost", port=1234)
+        mock_send_command.return_value = "SUCCESS: bytecount interval changed\r\n"
+        vpn.set_bytecount(5)
+        mock_send_command.assert_called_once_with("bytecount 5")
+        mock_send_command.return_value = "ERROR: bytecount parameter must be an integer\r\n"
+        with self.assertRaises(errors.ParseError):
+            vpn.set_bytecount(5)
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.VPN._socket_send")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_send_command_notifications(self, mock_create_connection, mock_socket_send, mock_socket_recv):
+        vpn = VPN(host="localhost", port=1234)
+        mock_socket_recv.return_value = GREETING
+        vpn.connect()
+        vals = gen_mock_values(
+            [
+                ">BYTECOUNT:1,2\r\nOpenVPN CLIENT LIST\r\nUpd",
+                "ated,Thu Jul 18 20:47:42 2019\r\n>CLIENT:ESTAB",
+                "LISHED,1\r\nEND\r\n>BYTECOUNT:3,4\r\n",
+            ]
+        )
+        mock_socket_recv.side_effect = lambda: next(vals)
+        self.assertEqual(
+            "OpenVPN CLIENT LIST\r\nUpdated,Thu Jul 18 20:47:42 2019\r\nEND\r\n", vpn.send_command("status 1")
+        )
+        self.assertEqual([">BYTECOUNT:1,2", ">CLIENT:ESTABLISHED,1", ">BYTECOUNT:3,4"], vpn.read_notifications())
+        self.assertFalse(vpn.notifications)
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.VPN._socket_send")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_send_command_notification_callback(self, mock_create_connection, mock_socket_send, mock_socket_recv):
+        notifications = []
+        vpn = VPN(host="localhost", port=1234, on_notification=notifications.append)
+        mock_socket_recv.return_value = ">INFO:OpenVPN Management Interface Version 1\r\n>HOLD:Waiting\r\n"
+        vpn.connect()
+        mock_socket_recv.return_value = ">STATE:1560719601,CONNECTED\r\nSUCCESS: pid=1\r\n"
+        self.assertEqual("SUCCESS: pid=1\r\n", vpn.send_command("pid"))
+        self.assertEqual([">HOLD:Waiting", ">STATE:1560719601,CONNECTED"], notifications)
+        self.assertFalse(vpn.notifications)
+
+    def test_read_notifications(self):
+        vpn = VPN(unix_socket="file.sock", max_notifications=2)
+        vpn._socket, server = socket.socketpair()
+        try:
+            self.assertEqual([], vpn.read_notifications())
+            server.sendall(b">BYTECOUNT:1,2\r\n>BYTECOUNT:3,4\r\n>BYTECOUNT:5,6\r\n>BYTE")
+            self.assertEqual([">BYTECOUNT:3,4", ">BYTECOUNT:5,6"], vpn.read_notifications(timeout=1))
+            server.sendall(b"COUNT:7,8\r\n")
+            self.assertEqual([">BYTECOUNT:7,8"], vpn.read_notifications(timeout=1))
+            server.close()
+            with self.assertRaises(errors.ConnectError):
+                vpn.read_notifications(timeout=1)
+            self.assertFalse(vpn.is_connected)
+        finally:
+            server.close()
+
+    def test_notification_overflow(self):
+        for policy, expected in (
+            (OverflowPolicy.DROP_OLDEST, [">BYTECOUNT:3,4", ">BYTECOUNT:5,6"]),
+            (OverflowPolicy.DROP_NEWEST, [">BYTECOUNT:1,2", ">BYTECOUNT:3,4"]),
+        ):
+            with self.subTest(policy):
+                vpn = VPN(unix_socket="file.sock", max_notifications=2, overflow=policy)
+                vpn._socket, server = socket.socketpair()
+                self.addCleanup(server.close)
+                server.sendall(b">BYTECOUNT:1,2\r\n>BYTECOUNT:3,4\r\n>BYTECOUNT:5,6\r\n")
+                self.assertEqual(expected, vpn.read_notifications(timeout=1))
+                self.assertEqual(1, vpn.notifications_dropped)
+                self.assertEqual(0, vpn.buffered_bytes)
+        vpn = VPN(unix_socket="file.sock", max_notifications=2, overflow="error")
+        vpn._socket, server = socket.socketpair()
+        self.addCleanup(server.close)
+        server.sendall(b">BYTECOUNT:1,2\r\n>BYTECOUNT:3,4\r\n>BYTECOUNT:5,6\r\n")
+        with self.assertRaises(errors.BufferOverflowError):
+            vpn.read_notifications(timeout=1)
+        self.assertFalse(vpn.is_connected)
+
+    def test_line_length_limit(self):
+        vpn = VPN(unix_socket="file.sock", max_line_length=100)
+        vpn._socket, server = socket.socketpair()
+        self.addCleanup(server.close)
+        server.sendall(b"OpenVPN CLIENT LIST\r\n" + b"x" * 101)
+        with self.assertRaises(errors.BufferOverflowError):
+            vpn.send_command("status 1")
+        self.assertFalse(vpn.is_connected)
+        self.assertEqual(0, vpn.buffered_bytes)
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.VPN._socket_send")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_reconnect(self, mock_create_connection, mock_socket_send, mock_socket_recv):
+        vpn = VPN(host="localhost", port=1234)
+        mock_socket_recv.return_value = ">INFO:OpenVPN Management Interface Version 1\r\n>HOLD:Wait\r\n>BYTE"
+        vpn.connect()
+        vpn._release = "OpenVPN 2.4.4"
+        self.assertEqual(
+            {
+                "buffered_bytes": len(">HOLD:Wait") + len(">BYTE"),
+                "notifications_queued": 1,
+                "notifications_dropped": 0,
+                "connects": 1,
+                "reconnects": 0,
+            },
+            vpn.resource_usage(),
+        )
+        # A broken connection is still closed and any incomplete line from it discarded, queued notifications are kept
+        mock_socket_send.side_effect = BrokenPipeError()
+        vpn.reconnect()
+        mock_create_connection.return_value.close.assert_called()
+        self.assertTrue(vpn.is_connected)
+        self.assertEqual(1, vpn.reconnects)
+        self.assertIsNone(vpn._release)
+        self.assertEqual(len(">BYTE"), len(vpn._lines))
+        self.assertEqual([">HOLD:Wait", ">HOLD:Wait"], vpn.read_notifications())
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_connect_when_connected(self, mock_create_connection, mock_socket_recv):
+        first, second = MagicMock(), MagicMock()
+        mock_create_connection.side_effect = [first, second]
+        mock_socket_recv.return_value = GREETING
+        vpn = VPN(host="localhost", port=1234)
+        vpn.connect()
+        vpn.connect()
+        first.sendall.assert_called_once_with(b"quit\n")
+        first.close.assert_called_once()
+        second.close.assert_not_called()
+        self.assertIs(second, vpn._socket)
+        self.assertEqual(1, vpn.reconnects)
+
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_split_character(self, mock_create_connection):
+        server, mock_create_connection.return_value = socket.socketpair()
+        self.addCleanup(server.close)
+        server.sendall(GREETING.encode())
+        vpn = VPN(host="localhost", port=1234, health=EndpointHealth())
+        vpn.connect()
+        # Two byte character split across the first 4096 byte read
+        resp = "SUCCESS: " + "a" * (4095 - len("SUCCESS: ")) + "\u00e9\r\n"
+        server.sendall(resp.encode())
+        self.assertEqual(resp, vpn.send_command("pid"))
+        # Invalid UTF-8 closes the connection
+        server.sendall(b"SUCCESS: \xff\r\n")
+        with self.assertRaises(errors.ConnectError):
+            vpn.send_command("pid")
+        self.assertFalse(vpn.is_connected)
+        self.assertEqual(1, vpn.health.total_failures)
+
+    @patch("openvpn_api.vpn.VPN._socket_recv")
+    @patch("openvpn_api.vpn.socket.create_connection")
+    def test_connect_bad_greeting(self, mock_create_connection, mock_socket_recv):
+        vpn = VPN(host="localhost", port=1234)
+        mock_socket_recv.return_value = "asd\r\n"
+        with self.assertRaises(AssertionError):
+            vpn.connect()
+        mock_create_connection.return_value.close.assert_called_once()
+        self.assertFalse(vpn.is_connected)
+        self.assertEqual(0, vpn.connects)